@@ -15,6 +15,17 @@ register(
     entry_point='gym_decomp.gridworld:CliffworldDeterministicV0'
 )
 
+register(
+    id='GeneratedGridworld-v0',
+    entry_point='gym_decomp.gridworld:GeneratedGridworldV0'
+)
+
+register(
+    id='GeneratedGridworldLarge-v0',
+    entry_point='gym_decomp.gridworld:GeneratedGridworldV0',
+    kwargs={'shape': (1000, 1000), 'obs_mode': 'index'}
+)
+
 register(
     id="HivSimulator-v0",
     entry_point='gym_decomp.hiv:HivSimV0'
@@ -0,0 +1,223 @@
+"""
+Throughput and latency benchmarks for the registered environments.
+
+Run `python -m gym_decomp.benchmark --output results.json` to benchmark the default
+environments, and compare the JSON of two runs to catch regressions. Environments whose
+backend is missing (SCAII, or the HIV simulator) are reported as skipped.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+import tracemalloc
+
+import gym
+import numpy as np
+
+import gym_decomp as _
+from gym_decomp.util import write_json_atomic
+
+DEFAULT_ENV_IDS = ['MiniGridworld-v0', 'Cliffworld-v0', 'CliffworldDeterministic-v0',
+                   'GeneratedGridworld-v0', 'HivSimulator-v0', 'ScaiiFourTowers-v1']
+
+# The model functions of the gridworlds
+MODEL_CALLS = ['transition_prob', 'reward', 'is_terminal']
+
+
+def _peak_rss_kb():
+    # `resource` is Unix only
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _percentiles(times):
+    times = np.asarray(times)
+    return {'mean': float(times.mean()),
+            'p50': float(np.percentile(times, 50)),
+            'p99': float(np.percentile(times, 99))}
+
+
+def _skip_reason(env_id):
+    if env_id.startswith('Scaii'):
+        from gym_decomp.scaii import bootstrap
+        if not bootstrap.is_installed():
+            return "SCAII is not installed"
+    return None
+
+
+def _time_steps(env, actions):
+    step_times, num_resets = [], 0
+    for action in actions:
+        start = time.perf_counter()
+        _, _, terminal, _ = env.step(action)
+        step_times.append(time.perf_counter() - start)
+        if terminal:
+            env.reset()
+            num_resets += 1
+    return step_times, num_resets
+
+
+def _allocations(env, actions):
+    """
+    The mean peak of memory allocated (and not necessarily kept) during a step. Before
+    Python 3.9 the peak can't be reset, so this is the peak over all of the steps instead.
+    """
+    per_step = hasattr(tracemalloc, 'reset_peak')
+    tracemalloc.start()
+    try:
+        peaks = []
+        start, _ = tracemalloc.get_traced_memory()
+        for action in actions:
+            base, _ = tracemalloc.get_traced_memory()
+            if per_step:
+                tracemalloc.reset_peak()
+            _, _, terminal, _ = env.step(action)
+            if per_step:
+                peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            if terminal:
+                env.reset()
+        if not per_step:
+            peaks.append(tracemalloc.get_traced_memory()[1] - start)
+    finally:
+        tracemalloc.stop()
+    return float(np.mean(peaks))
+
+
+def _model_calls(env, num_calls, rng):
+    states = env.states
+    picks = rng.randint(len(states), size=(num_calls, 2))
+    actions = rng.randint(env.action_space.n, size=num_calls)
+
+    calls = {
+        'transition_prob': lambda i: env.transition_prob(states[picks[i, 0]], actions[i],
+                                                          states[picks[i, 1]]),
+        'reward': lambda i: env.reward(states[picks[i, 0]]),
+        'is_terminal': lambda i: env.is_terminal(states[picks[i, 0]]),
+    }
+
+    results = {}
+    for name in MODEL_CALLS:
+        call = calls[name]
+        start = time.perf_counter()
+        for idx in range(num_calls):
+            call(idx)
+        results[name] = {'calls_per_sec': num_calls / (time.perf_counter() - start)}
+    return results
+
+
+def benchmark_env(env_id, steps=1000, resets=20, alloc_steps=200, model_calls=1000, seed=0):
+    """
+    Benchmarks a single environment id, returning a dict of:
+
+    - `make_sec`: how long `gym.make` took
+    - `reset_sec`: mean, p50 and p99 of `reset` latency, over `resets` resets
+    - `steps_per_sec` and `step_sec` (mean, p50 and p99 latency), over `steps` random
+      actions, not counting the resets of finished episodes
+    - `alloc_bytes_per_step`: the mean peak of memory allocated by Python during a step
+    - `peak_rss_kb`: the peak resident memory of the process so far, or None where it
+      can't be measured (Windows)
+    - `model`: calls per second of each of `MODEL_CALLS`, for environments that have them
+
+    or `{'skipped': reason}` if the environment's backend isn't available.
+    """
+    reason = _skip_reason(env_id)
+    if reason is not None:
+        return {'skipped': reason}
+
+    start = time.perf_counter()
+    try:
+        env = gym.make(env_id)
+    except ImportError as err:
+        return {'skipped': "Missing dependency: %s" % err}
+    make_sec = time.perf_counter() - start
+
+    rng = np.random.RandomState(seed)
+    env.seed(seed)
+    n_actions = env.action_space.n
+
+    reset_times = []
+    for _ in range(resets):
+        start = time.perf_counter()
+        env.reset()
+        reset_times.append(time.perf_counter() - start)
+
+    step_times, num_resets = _time_steps(env, rng.randint(n_actions, size=steps))
+    result = {
+        'make_sec': make_sec,
+        'reset_sec': _percentiles(reset_times),
+        'steps_per_sec': steps / sum(step_times),
+        'step_sec': _percentiles(step_times),
+        'episodes': num_resets,
+        'alloc_bytes_per_step': _allocations(env, rng.randint(n_actions, size=alloc_steps)),
+        'peak_rss_kb': _peak_rss_kb(),
+    }
+
+    unwrapped = env.unwrapped
+    if all(hasattr(unwrapped, name) for name in MODEL_CALLS) and model_calls:
+        result['model'] = _model_calls(unwrapped, model_calls, rng)
+
+    env.close()
+    return result
+
+
+def run_benchmarks(env_ids=None, isolate=True, **kwargs):
+    """
+    Benchmarks each environment id (`DEFAULT_ENV_IDS` by default) with `benchmark_env`,
+    returning a JSON-ready dict of the results along with the platform they ran on.
+
+    With `isolate=True` every environment runs in a fresh process, so memory numbers
+    aren't inflated by the environments before it.
+    """
+    env_ids = DEFAULT_ENV_IDS if env_ids is None else env_ids
+
+    results = {}
+    for env_id in env_ids:
+        if isolate:
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                results[env_id] = pool.apply(benchmark_env, (env_id,), kwargs)
+        else:
+            results[env_id] = benchmark_env(env_id, **kwargs)
+
+    return {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'settings': kwargs,
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--env', action='append', dest='env_ids',
+                        help="An environment id to benchmark, may be repeated "
+                             "(default: %s)" % ", ".join(DEFAULT_ENV_IDS))
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--resets', type=int, default=20)
+    parser.add_argument('--alloc-steps', type=int, default=200)
+    parser.add_argument('--model-calls', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-isolate', action='store_false', dest='isolate',
+                        help="Run every environment in this process")
+    parser.add_argument('--output', help="Where to write the JSON results (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.env_ids, isolate=args.isolate, steps=args.steps,
+                            resets=args.resets, alloc_steps=args.alloc_steps,
+                            model_calls=args.model_calls, seed=args.seed)
+
+    if args.output:
+        write_json_atomic(args.output, report)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,9 @@ import gym
 from gym import spaces
 from gym.utils import seeding
 
+import numpy as np
+
+from gym_decomp.profiling import PhaseTimer
 
 # pylint: disable=C0103
 
@@ -12,22 +15,58 @@ class __Gridworld(gym.Env, metaclass=ABCMeta):
     """
     A basic gridworld containing multiple reward types (dependent on the exact domain).
 
-    Observation Space: A vector that one-hot encodes the map position
+    Observation Space: A vector that one-hot encodes the map position, or with
+    `obs_mode='index'` the integer index of the position (see `Gridworld.state_coords`)
     Action Space: `Discrete(4)` corresponding to up, down, left, or right
+
+    The model functions (`transition_prob`, `reward` and `is_terminal`) accept
+    states in either form.
+
+    With `array_decomposition=True`, `info['reward_decomposition']` is an array ordered
+    like `reward_types` instead of a dict.
+
+    One-hot observations are `obs_dtype` arrays (e.g. `np.float32` or `np.uint8`). With
+    `obs_buffer=True` every `step` and `reset` returns the same preallocated array,
+    updated in place, so copy an observation if you need to keep it.
+
+    `get_state` and `set_state` snapshot and restore the position and the random state,
+    so planners can branch from any point of an episode without building a new env.
+
+    With `profile=True`, the phases of `step` and `reset` are timed by a `PhaseTimer`
+    available as `profiler`.
     """
 
     metadata = {'render.modes': ['println']}
 
-    def __init__(self, world):
+    def __init__(self, world, obs_mode='onehot', obs_dtype=np.float64, obs_buffer=False,
+                 array_decomposition=False, profile=False):
         from gym_decomp.gridworld.raw.q_world import QWorld as __QWorld
 
+        if obs_mode not in ['onehot', 'index']:
+            raise ValueError("Unknown observation mode: " + str(obs_mode))
+
         self.np_random, _ = seeding.np_random(None)
         _world = __QWorld(world, self.np_random)
         self.__world = _world
-        self.states = _world.states
+        self.__raw_world = world
+        self.__obs_mode = obs_mode
+        self.__array_decomposition = array_decomposition
+        self.__profiler = PhaseTimer() if profile else None
+        self.__obs_dtype = np.dtype(obs_dtype)
+        self.__obs_size = int(np.prod(world.shape))
+        self.__cells = np.ravel_multi_index(tuple(world.state_coords.T), world.shape)
+        self.__obs_buffer = None
+        self.__hot_cell = None
+        if obs_buffer:
+            self.__obs_buffer = np.zeros(self.__obs_size, dtype=self.__obs_dtype)
+
+        if obs_mode == 'index':
+            self.observation_space = spaces.Discrete(world.num_states)
+        else:
+            self.observation_space = spaces.Box(
+                0, 1, (self.__obs_size,), dtype=self.__obs_dtype)
         self.__curr_state = None
         self.action_space = spaces.Discrete(4)
-        self.__action_map = ['u', 'd', 'l', 'r']
         self.seed()
 
     def transition_prob(self,state,action,next_state):
@@ -43,25 +82,117 @@ class __Gridworld(gym.Env, metaclass=ABCMeta):
     def reward_types(self):
         return self.__world.reward_types
 
+    @property
+    def states(self):
+        """
+        Every passable state, encoded like the observations
+        """
+        if self.__obs_mode == 'index':
+            return range(self.__raw_world.num_states)
+        return self.__raw_world.onehot_matrix(self.__obs_dtype)
+
+    @property
+    def obs_mode(self):
+        """
+        How observations are encoded, either `'onehot'` or `'index'`
+        """
+        return self.__obs_mode
+
+    @property
+    def array_decomposition(self):
+        """
+        Whether the reward decomposition is given as an array in the order of `reward_types`
+        (as opposed to a dict). The array is read-only, copy it if you need to modify it.
+        """
+        return self.__array_decomposition
+
+    @array_decomposition.setter
+    def array_decomposition(self, val):
+        self.__array_decomposition = val
+
+    @property
+    def profiler(self):
+        """
+        The `PhaseTimer` timing `step` (phases `act`, `decomposition` and `observe`) and
+        `reset` (phases `reset` and `observe`), or None if profiling is off
+        """
+        return self.__profiler
+
     @property
     def action_meanings(self):
         return ['up', 'down', 'left', 'right']
 
     def reset(self):
-        self.__curr_state = self.__world.reset()
+        profiler = self.__profiler
+        if profiler:
+            profiler.start()
+
+        self.__curr_state = self.__raw_world.index_of(self.__world.reset())
+        if profiler:
+            profiler.lap('reset')
 
-        return self.__world.statify(self.__curr_state).flatten()
+        state = self.__observe(self.__curr_state)
+        if profiler:
+            profiler.lap('observe')
+
+        return state
 
     def step(self, action):
-        action = self.__action_map[action]
-        nxt, decomp_reward, reward, terminal = self.__world.act(self.__curr_state, action)
+        profiler = self.__profiler
+        if profiler:
+            profiler.start()
+
+        if self.__curr_state is None:
+            raise Exception("Cannot step before the environment is reset")
+        nxt, rewards, reward, terminal = self.__world.act_index(self.__curr_state, action)
         self.__curr_state = nxt
-        info = {'reward_decomposition': decomp_reward}
+        if profiler:
+            profiler.lap('act')
+
+        if self.__array_decomposition:
+            info = {'reward_decomposition': rewards}
+        else:
+            info = {'reward_decomposition': dict(zip(self.reward_types, rewards))}
+        if profiler:
+            profiler.lap('decomposition')
 
-        state = self.__world.statify(self.__curr_state).flatten()
+        state = self.__observe(self.__curr_state)
+        if profiler:
+            profiler.lap('observe')
 
         return state, reward, terminal, info
 
+    def get_state(self):
+        """
+        A snapshot of the current position (a state index) and the state of `np_random`.
+        The world itself is static, so it is not copied.
+        """
+        return self.__curr_state, self.np_random.get_state()
+
+    def set_state(self, snapshot):
+        """
+        Restores a snapshot taken by `get_state`, returning the observation of its position
+        """
+        self.__curr_state, rng_state = snapshot
+        self.np_random.set_state(rng_state)
+        return self.__observe(self.__curr_state)
+
+    def __observe(self, state):
+        if self.__obs_mode == 'index':
+            return state
+
+        cell = self.__cells[state]
+        if self.__obs_buffer is None:
+            obs = np.zeros(self.__obs_size, dtype=self.__obs_dtype)
+            obs[cell] = 1
+            return obs
+
+        if self.__hot_cell is not None:
+            self.__obs_buffer[self.__hot_cell] = 0
+        self.__obs_buffer[cell] = 1
+        self.__hot_cell = cell
+        return self.__obs_buffer
+
     def close(self):
         pass
 
@@ -73,9 +204,10 @@ class __Gridworld(gym.Env, metaclass=ABCMeta):
         return [seed1, seed2]
 
     def render(self, mode="print"):
+        state = self.__raw_world.coord_of(self.__curr_state)
         if mode == 'print':
-            return str(self.__world.statify(self.__curr_state))
-        return self.__world.statify(self.__curr_state)
+            return str(self.__world.statify(state))
+        return self.__world.statify(state)
 
 
 class CliffworldV0(__Gridworld):
@@ -83,11 +215,11 @@ class CliffworldV0(__Gridworld):
     A small toy problem with several reward types and a "cliff" along the bottom you can fall off
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         from gym_decomp.gridworld.raw.worlds import Cliffworld as __Cliffworld
 
         world = __Cliffworld()
-        super().__init__(world)
+        super().__init__(world, **kwargs)
 
 
 class MiniGridworldV0(__Gridworld):
@@ -95,11 +227,11 @@ class MiniGridworldV0(__Gridworld):
     A tiny toy problem, mainly for testing purposes
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         from gym_decomp.gridworld.raw.worlds import MiniGridworld as __MiniGridworld
 
         world = __MiniGridworld()
-        super().__init__(world)
+        super().__init__(world, **kwargs)
 
 
 class CliffworldDeterministicV0(__Gridworld):
@@ -109,8 +241,148 @@ class CliffworldDeterministicV0(__Gridworld):
     Unlike the normal one, this one has no ability to "fall"
     """
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         from gym_decomp.gridworld.raw.worlds import Cliffworld as __Cliffworld
 
         world = __Cliffworld(misfire_prob=0.0)
-        super().__init__(world)
+        super().__init__(world, **kwargs)
+
+
+class GeneratedGridworldV0(__Gridworld):
+    """
+    A randomly generated gridworld of any size, for stress testing at scale.
+
+    Takes the arguments of `gym_decomp.gridworld.raw.worlds.generate` plus the observation
+    options.
+    For large maps `obs_mode='index'` avoids building huge one-hot observations.
+    """
+
+    def __init__(self, shape=(32, 32), n_reward_types=4, density=0.05, seed=0,
+                 obs_mode='onehot', obs_dtype=np.float64, obs_buffer=False,
+                 array_decomposition=False, profile=False, **kwargs):
+        from gym_decomp.gridworld.raw.worlds import generate as __generate
+
+        world = __generate(shape, n_reward_types, density, seed=seed, **kwargs)
+        super().__init__(world, obs_mode=obs_mode, obs_dtype=obs_dtype, obs_buffer=obs_buffer,
+                         array_decomposition=array_decomposition, profile=profile)
+
+
+class VectorGridworld(object):
+    """
+    Steps `num_envs` independent copies of a raw `Gridworld` at once. Every agent's position
+    is kept as a state index in a single integer array, and each step samples all of the
+    successors from the world's compiled transition table in one go.
+
+    Finished episodes are reset automatically, so the observation returned for an
+    environment that just terminated is the first observation of its next episode.
+
+    Observation Space: An `(num_envs, H*W)` array, one-hot encoding each map position, or
+    with `obs_mode='index'` an `(num_envs,)` array of state indices
+    Action Space: `Discrete(4)` for each environment, corresponding to up, down, left, or right
+
+    As with the single gridworlds, one-hot observations are `obs_dtype` arrays and
+    `obs_buffer=True` reuses one preallocated observation array for every call.
+    """
+
+    def __init__(self, world, num_envs, obs_mode='onehot', obs_dtype=np.float64,
+                 obs_buffer=False):
+        if obs_mode not in ['onehot', 'index']:
+            raise ValueError("Unknown observation mode: " + str(obs_mode))
+
+        self.__world = world
+        self.__num_envs = num_envs
+        self.__obs_mode = obs_mode
+        self.action_space = spaces.Discrete(4)
+
+        self.__succs = world.successor_indices
+        self.__cum_probs = world.successor_cum_probs
+        self.__starts = world.nonterminal_indices
+        self.__cells = np.ravel_multi_index(tuple(world.state_coords.T), world.shape)
+        self.__obs_size = int(np.prod(world.shape))
+        self.__obs_dtype = np.dtype(obs_dtype)
+        self.__obs_buffer = None
+        if obs_buffer and obs_mode == 'onehot':
+            self.__obs_buffer = np.zeros((num_envs, self.__obs_size), dtype=self.__obs_dtype)
+        self.__hot_cells = None
+        self.__curr_states = None
+
+        self.np_random = None
+        self.seed()
+
+    @property
+    def num_envs(self):
+        """
+        The number of environments stepped by each call
+        """
+        return self.__num_envs
+
+    @property
+    def curr_states(self):
+        """
+        The current state index of every environment
+        """
+        return self.__curr_states
+
+    @property
+    def reward_types(self):
+        return [*self.__world.rewards.keys()]
+
+    @property
+    def action_meanings(self):
+        return ['up', 'down', 'left', 'right']
+
+    def reset(self):
+        self.__curr_states = self.np_random.choice(self.__starts, self.num_envs)
+        return self.__observe(self.__curr_states)
+
+    def step(self, actions):
+        """
+        Takes one action per environment, given as an `(num_envs,)` integer array.
+
+        Returns the `(num_envs, H*W)` observations, `(num_envs,)` total rewards and terminal flags,
+        and an info dict whose `reward_decomposition` is an `(num_envs, len(reward_types))` array
+        in the order of `reward_types`.
+        """
+        states = self.__curr_states
+        if states is None:
+            raise Exception("Cannot step before the environment is reset")
+        cum_probs = self.__cum_probs[states, actions]
+        rolls = self.np_random.rand(self.num_envs)
+        slots = np.minimum((rolls[:, None] >= cum_probs).sum(axis=1), cum_probs.shape[1] - 1)
+        nxt = self.__succs[states, actions, slots]
+
+        decomp_reward = self.__world.state_rewards[nxt]
+        reward = self.__world.state_total_rewards[nxt]
+        terminal = self.__world.state_terminals[nxt]
+
+        num_done = np.count_nonzero(terminal)
+        if num_done:
+            nxt[terminal] = self.np_random.choice(self.__starts, num_done)
+        self.__curr_states = nxt
+
+        info = {'reward_decomposition': decomp_reward}
+
+        return self.__observe(nxt), reward, terminal, info
+
+    def __observe(self, states):
+        if self.__obs_mode == 'index':
+            return states.copy()
+
+        rows, cells = np.arange(self.num_envs), self.__cells[states]
+        if self.__obs_buffer is None:
+            obs = np.zeros((self.num_envs, self.__obs_size), dtype=self.__obs_dtype)
+            obs[rows, cells] = 1
+            return obs
+
+        if self.__hot_cells is not None:
+            self.__obs_buffer[rows, self.__hot_cells] = 0
+        self.__obs_buffer[rows, cells] = 1
+        self.__hot_cells = cells
+        return self.__obs_buffer
+
+    def close(self):
+        pass
+
+    def seed(self, seed=None):
+        self.np_random, seed1 = seeding.np_random(seed)
+        return [seed1]
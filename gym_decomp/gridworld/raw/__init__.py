@@ -1,29 +1,63 @@
-import itertools
-
 import numpy as np
 
+# Past this many `P[S, A, S']` entries the compiled transition model is stored sparse
+DENSE_TRANSITION_LIMIT = 2 ** 22
+
+
+def _state_values(vals, index, cells):
+    """
+    The values of a world-shaped dense or `scipy.sparse` array at each passable state,
+    in state index order
+    """
+    if not hasattr(vals, 'tocoo'):
+        return np.asarray(vals, dtype=float)[cells]
+
+    vals = vals.tocoo()
+    out = np.zeros(len(cells[0]))
+    idx = index[vals.row, vals.col]
+    np.add.at(out, idx[idx >= 0], vals.data[idx >= 0])
+    return out
+
 
 class Gridworld(object):
+    """
+    A gridworld with one reward map per reward type.
+
+    Reward maps may be `scipy.sparse` matrices (e.g. COO) for large worlds where most
+    tiles give no reward, in which case `total_reward` is sparse as well. `misfires`
+    may be `None` if no tile misfires.
+    """
+
     def __init__(self, rewards, terminals, misfires, impassable, world_shape,
                  name, misfire_prob=0.1):
         self.__terminals = terminals
         assert terminals.shape == world_shape
         self.__misfires = misfires
-        assert misfires.shape == world_shape
+        assert misfires is None or misfires.shape == world_shape
         self.__impassable = impassable
         assert impassable.shape == world_shape
         self.__rewards = rewards
 
         self.__shape = world_shape
-        self.__total_reward = np.zeros(world_shape)
+        if any(hasattr(vals, 'tocoo') for vals in rewards.values()):
+            from scipy import sparse
+
+            self.__total_reward = sparse.coo_matrix(world_shape)
+        else:
+            self.__total_reward = np.zeros(world_shape)
         for _, vals in self.rewards.items():
-            self.__total_reward += vals
+            self.__total_reward = self.__total_reward + vals
             assert world_shape == vals.shape
+        if hasattr(self.__total_reward, 'tocoo'):
+            self.__total_reward = self.__total_reward.tocoo()
 
         self.__actions = ['u', 'd', 'l', 'r']
+        self.__action_index = {action: i for i, action in enumerate(self.__actions)}
         self.__misfire_prob = misfire_prob
         self.name = name
 
+        self.__compile()
+
     @property
     def terminals(self):
         return self.__terminals
@@ -58,8 +92,10 @@ class Gridworld(object):
 
     @property
     def states(self):
-        return filter(lambda x: not self.impassable[x],
-                      itertools.product(range(self.shape[0]), range(self.shape[1])))
+        """
+        Every passable state as a coordinate tuple, in state index order
+        """
+        return self.__states
 
     def statify(self, state):
         """
@@ -80,86 +116,324 @@ class Gridworld(object):
         return out
 
     def nonterminal_states(self):
-        return filter(lambda x: not self.terminals[x], self.states)
+        return self.__nonterminal_states
 
     def successors(self, state, action):
-        return self.succ_map(state)[action]
+        """
+        The distinct states reachable by taking `action` in `state`, in sampling
+        order (the intended move first, followed by any misfires).
+        """
+        idx = self.index_of(state)
+        act = self.__action_index[action]
+        succs = []
+        for succ, prob in zip(self.__succ_indices[idx, act], self.__succ_probs[idx, act]):
+            succ = self.coord_of(succ)
+            if prob > 0 and succ not in succs:
+                succs.append(succ)
+
+        return succs
 
     def succ_map(self, state):
-        succs = {key: [val]
-                 for key, val in self.__direct_succ_map(state).items()}
+        return {action: self.successors(state, action) for action in self.actions}
 
-        if self.misfires[state] is None or self.misfires[state] == '':
-            return succs
+    def all_successors(self, state):
+        return set(self.coord_of(succ) for succ in self.__direct[self.index_of(state)])
 
-        for misfire in self.misfires[state]:
-            for succ in succs.keys():
-                if succ == misfire:
-                    continue
+    @property
+    def num_states(self):
+        """
+        The number of passable states, i.e. the size of the integer state indexing
+        """
+        return len(self.__coords)
 
-                if succs[misfire] not in succs[succ]:
-                    succs[succ].append(succs[misfire][0])
+    @property
+    def state_coords(self):
+        """
+        An `(S, 2)` array mapping each state index to its coordinate
+        """
+        return self.__coords
 
-        return succs
+    @property
+    def state_index(self):
+        """
+        An array the shape of the world mapping each coordinate to its state index,
+        or -1 for impassable tiles
+        """
+        return self.__index
 
-    def all_successors(self, state):
-        return set(self.__direct_succ_map(state).values())
+    @property
+    def successor_indices(self):
+        """
+        An `(S, A, K)` array of successor state indices for each state and action.
 
-    def __direct_succ_map(self, state):
-        succs = {}
-        if state[0] - 1 >= 0 and not self.impassable[state[0] - 1, state[1]]:
-            succs['u'] = (state[0] - 1, state[1])
-        else:
-            succs['u'] = state
+        Successors are ordered the way they're sampled, unused slots repeat the last
+        real successor with probability 0.
+        """
+        return self.__succ_indices
 
-        if state[0] + 1 < self.shape[0] and not self.impassable[state[0] + 1, state[1]]:
-            succs['d'] = (state[0] + 1, state[1])
-        else:
-            succs['d'] = state
+    @property
+    def successor_probs(self):
+        """
+        An `(S, A, K)` array of the probabilities matching `successor_indices`
+        """
+        return self.__succ_probs
 
-        if state[1] - 1 >= 0 and not self.impassable[state[0], state[1] - 1]:
-            succs['l'] = (state[0], state[1] - 1)
-        else:
-            succs['l'] = state
+    @property
+    def successor_cum_probs(self):
+        """
+        An `(S, A, K)` array of the running totals of `successor_probs`, for sampling
+        """
+        return self.__succ_cum_probs
 
-        if state[1] + 1 < self.shape[1] and not self.impassable[state[0], state[1] + 1]:
-            succs['r'] = (state[0], state[1] + 1)
-        else:
-            succs['r'] = state
+    @property
+    def deterministic(self):
+        """
+        Whether every action has exactly one possible successor
+        """
+        return self.__succ_indices.shape[-1] == 1
 
-        return succs
+    @property
+    def transition_tensor(self):
+        """
+        The compiled transition model `P[S, A, S']`.
+
+        Small worlds get a dense array. Worlds over `DENSE_TRANSITION_LIMIT` entries
+        get a `scipy.sparse` CSR matrix of shape `(S * A, S')` instead, where row
+        `s * A + a` holds the distribution for state `s` and action `a`.
+        """
+        if isinstance(self.__transitions, np.ndarray):
+            return self.__transitions.reshape(
+                self.num_states, len(self.actions), self.num_states)
+        return self.__transitions
+
+    @property
+    def state_rewards(self):
+        """
+        An `(S, len(rewards))` array of the reward of each type, in the order of `rewards`,
+        for entering each state
+        """
+        return self.__state_rewards
+
+    @property
+    def state_total_rewards(self):
+        """
+        An `(S,)` array of the total reward for entering each state
+        """
+        return self.__state_total_rewards
+
+    @property
+    def state_terminals(self):
+        """
+        An `(S,)` boolean array of whether each state is terminal
+        """
+        return self.__state_terminals
+
+    @property
+    def nonterminal_indices(self):
+        """
+        The indices of the nonterminal states, which episodes start from
+        """
+        return self.__nonterminal_indices
+
+    @property
+    def onehot_states(self):
+        """
+        An `(S, H*W)` read-only matrix whose rows are the flattened `statify` of each state,
+        i.e. the rows of the identity matrix at the passable tiles. Built on first use.
+        """
+        return self.onehot_matrix()
+
+    def onehot_matrix(self, dtype=np.float64):
+        """
+        `onehot_states` as a `dtype` matrix, built once per dtype
+        """
+        dtype = np.dtype(dtype)
+        onehot = self.__onehot_states.get(dtype)
+        if onehot is None:
+            onehot = np.zeros((self.num_states, self.shape[0] * self.shape[1]), dtype=dtype)
+            onehot[np.arange(self.num_states), np.ravel_multi_index(tuple(self.__coords.T),
+                                                                    self.shape)] = 1
+            onehot.flags.writeable = False
+            self.__onehot_states[dtype] = onehot
+        return onehot
+
+    def index_of(self, state):
+        """
+        The integer index of a coordinate state.
+
+        Will raise an exception if given an impassable state, or one outside the map.
+        """
+        if not self.__in_bounds(state):
+            raise Exception("Tile is outside the map")
+        idx = self.__index[state]
+        if idx < 0:
+            raise Exception("Tile is impassable")
+        return int(idx)
+
+    def __in_bounds(self, state):
+        # Negative coordinates would otherwise wrap around when indexing
+        return 0 <= state[0] < self.shape[0] and 0 <= state[1] < self.shape[1]
+
+    def coord_of(self, idx):
+        """
+        The coordinate state for an integer state index
+        """
+        row, col = self.__coords[idx]
+        return int(row), int(col)
+
+    def __compile(self):
+        """
+        Builds the integer state indexing and the transition model once, so the
+        model queries are just array lookups.
+        """
+        coords = np.argwhere(~np.asarray(self.impassable, dtype=bool))
+        cells = tuple(coords.T)
+        num_states = len(coords)
+        idx_type = np.int32 if num_states < 2 ** 31 else np.intp
+        index = np.full(self.shape, -1, dtype=idx_type)
+        index[cells] = np.arange(num_states, dtype=idx_type)
+
+        # Direct successor of every state for every action, in the order of `actions`.
+        # Moving off the map or into an impassable tile leaves you where you are.
+        deltas = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+        direct = np.empty((num_states, len(deltas)), dtype=idx_type)
+        for act, (d_row, d_col) in enumerate(deltas):
+            rows, cols = coords[:, 0] + d_row, coords[:, 1] + d_col
+            in_bounds = (rows >= 0) & (rows < self.shape[0]) & (cols >= 0) & (cols < self.shape[1])
+            target = index[np.clip(rows, 0, self.shape[0] - 1), np.clip(cols, 0, self.shape[1] - 1)]
+            direct[:, act] = np.where(in_bounds & (target >= 0), target, index[cells])
+
+        succs, probs = self.__compile_successors(direct, cells)
+        cum_probs = np.cumsum(probs, axis=-1)
+
+        n_actions, width = len(self.actions), succs.shape[-1]
+        n_rows = num_states * n_actions
+        if n_rows * num_states <= DENSE_TRANSITION_LIMIT:
+            transitions = np.zeros((n_rows, num_states))
+            np.add.at(transitions, (np.repeat(np.arange(n_rows), width), succs.ravel()),
+                      probs.ravel())
+        else:
+            from scipy import sparse
+
+            if width == 1:
+                transitions = sparse.csr_matrix(
+                    (probs.ravel(), succs.ravel(), np.arange(n_rows + 1)),
+                    shape=(n_rows, num_states))
+            else:
+                transitions = sparse.csr_matrix(
+                    (probs.ravel(), (np.repeat(np.arange(n_rows), width), succs.ravel())),
+                    shape=(n_rows, num_states))
+                transitions.eliminate_zeros()
+
+        rewards = np.stack([_state_values(vals, index, cells) for vals in self.rewards.values()],
+                           axis=-1)
+        totals = _state_values(self.total_reward, index, cells)
+        terminals = np.asarray(self.terminals, dtype=bool)[cells]
+
+        nonterminals = np.flatnonzero(~terminals)
+
+        for arr in (coords, index, direct, succs, probs, cum_probs, rewards, totals, terminals,
+                    nonterminals):
+            arr.flags.writeable = False
+        if isinstance(transitions, np.ndarray):
+            transitions.flags.writeable = False
+
+        self.__coords = coords
+        self.__index = index
+        self.__direct = direct
+        self.__succ_indices = succs
+        self.__succ_probs = probs
+        self.__succ_cum_probs = cum_probs
+        self.__transitions = transitions
+        self.__state_rewards = rewards
+        self.__state_total_rewards = totals
+        self.__state_terminals = terminals
+        self.__nonterminal_indices = nonterminals
+        self.__states = tuple(map(tuple, coords.tolist()))
+        self.__nonterminal_states = tuple(self.__states[idx] for idx in nonterminals)
+        self.__onehot_states = {}
+
+    def __compile_successors(self, direct, cells):
+        """
+        Builds the padded `(S, A, K)` successor and probability tables from the direct
+        successors. Only states with misfires need more than one slot.
+        """
+        num_states, n_actions = direct.shape
+        misfired = np.zeros((num_states, n_actions), dtype=bool)
+        if self.misfires is not None:
+            misfires = self.misfires[cells]
+            if misfires.dtype.kind != 'U':
+                misfires = np.array(['' if m is None else m for m in misfires], dtype=str)
+            for act, action in enumerate(self.actions):
+                misfired[:, act] = np.char.find(misfires, action) >= 0
+        if self.misfire_prob <= 0:
+            misfired[:] = False
+
+        stochastic = np.flatnonzero(misfired.any(axis=-1))
+        misfired = misfired[stochastic]
+
+        # Slot 0 is the intended move, the rest are the other directions that may misfire
+        order = np.array([[act] + [other for other in range(n_actions) if other != act]
+                          for act in range(n_actions)])
+        m_succs = direct[stochastic][:, order]
+        m_probs = misfired[:, order] * self.misfire_prob
+        m_probs[..., 0] = 1.0 - misfired[:, order][..., 1:].sum(axis=-1) * self.misfire_prob
+
+        # Push impossible successors to the back and trim the table to the widest row
+        keep = np.argsort(m_probs <= 0, axis=-1, kind='stable')
+        m_succs = np.take_along_axis(m_succs, keep, axis=-1)
+        m_probs = np.take_along_axis(m_probs, keep, axis=-1)
+        n_valid = np.maximum((m_probs > 0).sum(axis=-1), 1)
+        width = int(n_valid.max()) if len(stochastic) else 1
+        m_succs, m_probs = m_succs[..., :width], m_probs[..., :width]
+        unused = np.arange(width) >= n_valid[..., None]
+        last = np.take_along_axis(m_succs, (n_valid - 1)[..., None], axis=-1)
+        m_succs = np.where(unused, last, m_succs)
+        m_probs[unused] = 0.0
+
+        succs = np.repeat(direct[..., None], width, axis=-1)
+        probs = np.zeros(succs.shape)
+        probs[..., 0] = 1.0
+        succs[stochastic] = m_succs
+        probs[stochastic] = m_probs
+
+        return succs, probs
 
     def transition_prob(self, state, action, nxt):
-        succs = self.__direct_succ_map(state)
         assert action in self.actions
-        if nxt not in succs.values() or self.impassable[nxt]:
+        if not self.__in_bounds(nxt):
+            return 0.0
+        nxt_idx = self.__index[nxt]
+        if nxt_idx < 0:
             return 0.0
 
-        misfires = self.misfires[state]
-        if misfires is None:
-            misfires = ''
-        misfires = misfires.replace(action, '')
-
-        if nxt == succs[action]:
-            return 1.0 - len(misfires) * self.misfire_prob
-
-        for action, succ in succs.items():
-            if succ == nxt and action in misfires:
-                return self.misfire_prob
+        row = self.index_of(state) * len(self.actions) + self.__action_index[action]
+        return float(self.__transitions[row, nxt_idx])
 
-        return 0.0
+    def index_transition_prob(self, state, action, nxt):
+        """
+        Like `transition_prob`, but with the states given as indices and the action given
+        as its position in `actions`
+        """
+        row = state * len(self.actions) + action
+        return float(self.__transitions[row, nxt])
 
     def transition_matrix(self, state, action):
-        return np.fromfunction(
-            np.vectorize(lambda x, y: self.transition_prob(
-                state, action, (int(x), int(y)))),
-            self.shape)
+        row = self.index_of(state) * len(self.actions) + self.__action_index[action]
+        probs = self.__transitions[row]
+        if not isinstance(probs, np.ndarray):
+            probs = probs.toarray().ravel()
+
+        out = np.zeros(self.shape)
+        out[tuple(self.__coords.T)] = probs
+        return out
 
     def __printable_elem(self, val, x, y):
         coord = (x, y)
         if self.impassable[coord]:
             return 'x'
-        elif self.misfires[coord] is not None and self.misfires[coord] != '':
+        elif self.misfires is not None and self.misfires[coord] is not None \
+                and self.misfires[coord] != '':
             return self.misfires[coord]
         elif val[coord] == 0:
             return ' '
@@ -170,6 +444,8 @@ class Gridworld(object):
         out = {}
 
         for typ, val in self.rewards.items():
+            if hasattr(val, 'toarray'):
+                val = val.toarray()
             # Error is wrong here, defining val inside the loop is fine since it's
             # only used locally
             #pylint: disable=W0640
@@ -178,9 +454,12 @@ class Gridworld(object):
                     val, int(x), int(y))),
                 self.shape)
 
+        total = self.total_reward
+        if hasattr(total, 'toarray'):
+            total = total.toarray()
         out["total"] = np.fromfunction(
             np.vectorize(lambda x, y: self.__printable_elem(
-                self.total_reward, int(x), int(y))),
+                total, int(x), int(y))),
             self.shape)
 
         return out
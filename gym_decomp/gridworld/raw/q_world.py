@@ -8,6 +8,13 @@ class QWorld(object):
         self.__shape = world.shape
         self.__actions = world.actions
         self.__reward_types = [*world.rewards.keys()]
+        self.__flat_index = world.state_index.ravel()
+        self.__action_index = {action: i for i, action in enumerate(world.actions)}
+
+        self.__succs = world.successor_indices
+        self.__cum_probs = world.successor_cum_probs
+        self.__last_slot = self.__succs.shape[-1] - 1
+        self.__deterministic = world.deterministic
 
     @property
     def np_random(self):
@@ -30,28 +37,34 @@ class QWorld(object):
         return self.__reward_types
 
     def reset(self):
-        non_terms = [*self.__world.nonterminal_states()]
+        non_terms = self.__world.nonterminal_states()
         idx = self.np_random.choice(len(non_terms), None)
         return non_terms[idx]
 
     def act(self, state, action):
-        cum_prob = 0.0
-        roll = self.np_random.rand()
+        idx = self.__world.index_of(state)
+        nxt, rewards, total, terminal = self.act_index(idx, self.__action_index[action])
+
+        return self.__world.coord_of(nxt), dict(zip(self.reward_types, rewards)), total, terminal
 
-        for nxt in self.__world.successors(state, action):
-            cum_prob += self.__world.transition_prob(
-                state, action, nxt)
-            if roll < cum_prob:
-                rewards = {}
-                for (typ, vals) in self.__world.rewards.items():
-                    rewards[typ] = vals[nxt]
-                total = self.__world.total_reward[nxt]
+    def act_index(self, state, action):
+        """
+        Like `act`, but with the state given as its index and the action as its position
+        in `actions`. Returns the index of the successor, and its rewards as an array in
+        the order of `reward_types`.
 
-                terminal = self.__world.terminals[nxt]
+        Draws exactly one number from `np_random` per call, even in deterministic worlds.
+        """
+        roll = self.np_random.rand()
 
-                return nxt, rewards, total, terminal
+        if self.__deterministic:
+            nxt = self.__succs[state, action, 0]
+        else:
+            slot = np.searchsorted(self.__cum_probs[state, action], roll, side='right')
+            nxt = self.__succs[state, action, min(slot, self.__last_slot)]
 
-        raise Exception("No successor state")
+        return (int(nxt), self.__world.state_rewards[nxt],
+                self.__world.state_total_rewards[nxt], self.__world.state_terminals[nxt])
 
     def statify(self, state):
         return self.__world.statify(state)
@@ -63,28 +76,50 @@ class QWorld(object):
 
     @property
     def states(self):
-        return [self.__world.statify(s).flatten() for s in self.__world.states]
-
-    def destatify(self,state):
-        i = int(np.where(state == 1)[0][0])
-        cord_state = (int(i / 5), i - int(i / 5) * 5)
-        assert (self.statify(cord_state).flatten() == state).all()
-        return cord_state
+        """
+        The flattened one-hot encoding of every state, as the rows of a read-only matrix
+        """
+        return self.__world.onehot_states
+
+    def destatify(self, state):
+        """
+        Transforms a flattened one-hot state back into its coordinate.
+
+        Also accepts an `(N, H*W)` batch of one-hot states, which is decoded with a single
+        argmax into an `(N, 2)` array of coordinates.
+        """
+        state = np.asarray(state)
+        if state.ndim == 2:
+            return self.__world.state_coords[self.state_index(state)]
+
+        return self.__world.coord_of(self.state_index(state))
+
+    def state_index(self, state):
+        """
+        The integer state index of a state, given either as an index already or as a
+        flattened one-hot state.
+
+        Also accepts an `(N, H*W)` batch of one-hot states, for which an `(N,)` array of
+        indices is returned.
+        """
+        state = np.asarray(state)
+        if state.ndim == 0:
+            return int(state)
+
+        idx = self.__flat_index[state.argmax(axis=-1)]
+        if (idx < 0).any():
+            raise Exception("Tile is impassable")
+
+        return idx if state.ndim == 2 else int(idx)
 
     def transition_prob(self, state, action, next_state):
-        action = self.__actions[action]
-        cord_state,cord_next_state = self.destatify(state), self.destatify(next_state)
-        return self.__world.transition_prob(cord_state, action, cord_next_state)
+        return self.__world.index_transition_prob(
+            self.state_index(state), action, self.state_index(next_state))
 
     def reward(self, state):
-        cord_state = self.destatify(state)
-        reward_info = {}
-        reward = 0
-        for (typ, vals) in self.__world.rewards.items():
-            reward_info[typ] = vals[cord_state]
-            reward += vals[cord_state]
-        return reward, reward_info
-
-    def is_terminal(self,state):
-        x,y = self.destatify(state)
-        return self.__world.terminals[x][y]
+        idx = self.state_index(state)
+        reward_info = dict(zip(self.reward_types, self.__world.state_rewards[idx]))
+        return self.__world.state_total_rewards[idx], reward_info
+
+    def is_terminal(self, state):
+        return self.__world.state_terminals[self.state_index(state)]
@@ -0,0 +1,69 @@
+"""
+Exact per-reward-type Q-values for gridworlds, computed on the compiled transition model.
+
+Like `QWorld.act`, rewards are received on entering a state and entering a terminal state
+ends the episode. All Q-values are returned as `Q[component, S, A]`, where components
+follow the order of `Gridworld.rewards`, states are the world's state indices and actions
+follow `Gridworld.actions`.
+"""
+import logging
+
+import numpy as np
+
+
+def value_iteration(world, gamma=0.9, tol=1e-8, max_iter=10000):
+    """
+    Decomposed Q-values of the optimal policy, i.e. the policy acting greedily
+    on the total of all the reward types.
+    """
+    return _solve(world, None, gamma, tol, max_iter)
+
+
+def policy_evaluation(world, policy, gamma=0.9, tol=1e-8, max_iter=10000):
+    """
+    Decomposed Q-values of a given policy. The policy is either an `(S,)` array with
+    the action to take in each state, or an `(S, A)` array of action probabilities.
+    """
+    policy = np.asarray(policy)
+    assert policy.shape[0] == world.num_states
+    return _solve(world, policy, gamma, tol, max_iter)
+
+
+def greedy_policy(q_values):
+    """
+    The `(S,)` array of actions maximizing the total of decomposed Q-values `Q[component, S, A]`
+    """
+    return q_values.sum(axis=0).argmax(axis=-1)
+
+
+def _solve(world, policy, gamma, tol, max_iter):
+    n_states, n_actions = world.num_states, len(world.actions)
+    transitions = world.transition_tensor
+    if isinstance(transitions, np.ndarray):
+        transitions = transitions.reshape(n_states * n_actions, n_states)
+
+    expected_rewards = transitions @ world.state_rewards
+    continues = ~world.state_terminals[:, None]
+    states = np.arange(n_states)
+
+    q_values = np.zeros((n_states, n_actions, len(world.rewards)))
+    delta = np.inf
+    for _ in range(max_iter):
+        if policy is None:
+            values = q_values[states, q_values.sum(axis=-1).argmax(axis=-1)]
+        elif policy.ndim == 1:
+            values = q_values[states, policy]
+        else:
+            values = np.einsum('sa,sac->sc', policy, q_values)
+
+        new_q = expected_rewards + gamma * (transitions @ (values * continues))
+        new_q = new_q.reshape(q_values.shape)
+        delta = np.abs(new_q - q_values).max()
+        q_values = new_q
+        if delta < tol:
+            break
+    else:
+        logging.warning("Solver for %s did not converge after %d iterations (delta: %g)",
+                        world.name, max_iter, delta)
+
+    return np.ascontiguousarray(q_values.transpose(2, 0, 1))
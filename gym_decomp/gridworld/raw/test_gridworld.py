@@ -118,6 +118,13 @@ def test_transition_prob():
         assert gridworld.transition_prob(source, 'u', state) == 0
         assert gridworld.transition_prob(source, 'l', state) == 0
 
+    # Coordinates outside the map are never reached, and don't wrap around
+    assert gridworld.transition_prob(source, 'u', (-3, 0)) == 0.0
+    assert gridworld.transition_prob(source, 'u', (4, 0)) == 0.0
+    assert gridworld.transition_prob(source, 'u', (1, 5)) == 0.0
+    with pytest.raises(Exception):
+        gridworld.index_of((-3, 0))
+
     mat = gridworld.transition_matrix(source, 'r')
     verify = np.zeros(gridworld.shape)
     verify[1, 1] = 1.0
@@ -199,3 +206,104 @@ def test_statify():
     ])
 
     assert (expected == gridworld.statify((3, 0))).all()
+
+
+def test_state_indexing():
+    gridworld = MiniGridworld()
+
+    assert gridworld.num_states == 6
+    for idx in range(gridworld.num_states):
+        state = gridworld.coord_of(idx)
+        assert gridworld.index_of(state) == idx
+        assert gridworld.state_index[state] == idx
+
+    assert gridworld.state_index[0, 0] == -1
+    with pytest.raises(Exception):
+        gridworld.index_of((0, 0))
+
+
+def test_cached_states():
+    gridworld = MiniGridworld()
+
+    assert gridworld.states == tuple(gridworld.coord_of(idx)
+                                     for idx in range(gridworld.num_states))
+    assert [*gridworld.nonterminal_states()] == [gridworld.coord_of(idx)
+                                                 for idx in gridworld.nonterminal_indices]
+    assert not gridworld.state_terminals[gridworld.nonterminal_indices].any()
+
+    onehot = gridworld.onehot_states
+    assert onehot is gridworld.onehot_states
+    assert not onehot.flags.writeable
+    for state, row in zip(gridworld.states, onehot):
+        assert (row == gridworld.statify(state).flatten()).all()
+
+
+def test_transition_tensor():
+    gridworld = MiniGridworld()
+
+    tensor = gridworld.transition_tensor
+    assert tensor.shape == (gridworld.num_states, 4, gridworld.num_states)
+    assert np.allclose(tensor.sum(axis=-1), 1.0)
+
+    for state in gridworld.states:
+        for a_idx, action in enumerate(gridworld.actions):
+            for nxt in gridworld.states:
+                assert tensor[gridworld.index_of(state), a_idx, gridworld.index_of(nxt)] \
+                    == gridworld.transition_prob(state, action, nxt)
+
+
+def test_sparse_transition_tensor(monkeypatch):
+    import gym_decomp.gridworld.raw as raw
+
+    dense = MiniGridworld()
+    monkeypatch.setattr(raw, 'DENSE_TRANSITION_LIMIT', 0)
+    gridworld = MiniGridworld()
+
+    assert not isinstance(gridworld.transition_tensor, np.ndarray)
+    assert np.allclose(gridworld.transition_tensor.toarray(),
+                       dense.transition_tensor.reshape(-1, dense.num_states))
+
+    for state in gridworld.states:
+        for action in gridworld.actions:
+            assert (gridworld.transition_matrix(state, action) ==
+                    dense.transition_matrix(state, action)).all()
+
+
+def test_generated_world():
+    from gym_decomp.gridworld.raw import Gridworld
+    from gym_decomp.gridworld.raw.worlds import generate
+
+    world = generate((40, 30), 3, 0.05, seed=0, misfire_density=0.1)
+    assert world.shape == (40, 30)
+    assert len(world.rewards) == 3
+    for vals in world.rewards.values():
+        assert vals.format == 'coo'
+        assert vals.nnz == 60
+
+    # The same world stored densely compiles to the same model
+    dense = Gridworld({typ: vals.toarray() for typ, vals in world.rewards.items()},
+                      world.terminals, world.misfires, world.impassable, world.shape,
+                      "Dense", misfire_prob=world.misfire_prob)
+    assert (dense.state_rewards == world.state_rewards).all()
+    assert (dense.state_total_rewards == world.state_total_rewards).all()
+    assert (dense.total_reward == world.total_reward.toarray()).all()
+    assert (dense.successor_indices == world.successor_indices).all()
+    assert (dense.transition_tensor.toarray() == world.transition_tensor.toarray()).all()
+    assert not world.deterministic
+
+    assert (generate((40, 30), 3, 0.05, seed=0).terminals == world.terminals).all()
+
+
+def test_generated_world_sparse_transitions():
+    from gym_decomp.gridworld.raw.worlds import generate
+
+    world = generate((100, 100), 2, 0.01, seed=1)
+    assert world.deterministic
+    assert not isinstance(world.transition_tensor, np.ndarray)
+    assert np.allclose(world.transition_tensor.sum(axis=1), 1.0)
+
+    state = world.coord_of(world.num_states // 2)
+    for action in world.actions:
+        mat = world.transition_matrix(state, action)
+        assert mat.sum() == 1.0
+        assert mat[world.successors(state, action)[0]] == 1.0
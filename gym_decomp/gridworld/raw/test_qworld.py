@@ -1,9 +1,10 @@
 """
 Test suite for the "qworld" exploration wrapper
 """
+import numpy as np
 from gym.utils import seeding
 
-from gym_decomp.gridworld.raw.worlds import MiniGridworld
+from gym_decomp.gridworld.raw.worlds import Cliffworld, MiniGridworld
 from gym_decomp.gridworld.raw.q_world import QWorld
 
 TEST_POINTS = 1000
@@ -46,3 +47,89 @@ def test_act():
     assert rewards['fail'] == 0
     assert total_reward == 0
     assert not terminal
+
+
+def test_destatify():
+    np_rand, _ = seeding.np_random(0)
+    underlying = MiniGridworld()
+    world = QWorld(underlying, np_rand)
+
+    for state in underlying.states:
+        onehot = world.statify(state).flatten()
+        assert world.destatify(onehot) == state
+        assert world.state_index(onehot) == underlying.index_of(state)
+
+    batch = np.stack(world.states)
+    assert (world.destatify(batch) == underlying.state_coords).all()
+    assert (world.state_index(batch) == np.arange(underlying.num_states)).all()
+
+    world = QWorld(Cliffworld(), np_rand)
+    assert world.destatify(world.statify((3, 4)).flatten()) == (3, 4)
+
+
+def test_model_queries():
+    np_rand, _ = seeding.np_random(0)
+    underlying = MiniGridworld()
+    world = QWorld(underlying, np_rand)
+
+    source, nxt = (3, 0), (3, 1)
+    onehot, nxt_onehot = world.statify(source).flatten(), world.statify(nxt).flatten()
+    idx, nxt_idx = underlying.index_of(source), underlying.index_of(nxt)
+
+    assert abs(world.transition_prob(onehot, 0, nxt_onehot) - 0.1) < 1e-4
+    assert world.transition_prob(idx, 0, nxt_idx) == world.transition_prob(onehot, 0, nxt_onehot)
+
+    total, rewards = world.reward(nxt_onehot)
+    assert total == -1 and rewards == {'success': 0, 'fail': -1}
+    assert world.reward(nxt_idx) == (total, rewards)
+
+    assert world.is_terminal(nxt_onehot) and world.is_terminal(nxt_idx)
+    assert not world.is_terminal(onehot)
+
+
+def reference_act(underlying, np_rand, state, action):
+    """
+    Successor sampling the way `act` used to do it, one `transition_prob` at a time
+    """
+    cum_prob = 0.0
+    roll = np_rand.rand()
+    for nxt in underlying.successors(state, action):
+        cum_prob += underlying.transition_prob(state, action, nxt)
+        if roll < cum_prob:
+            return nxt
+    raise Exception("No successor state")
+
+
+def test_act_reproducible():
+    for underlying in [Cliffworld(), Cliffworld(misfire_prob=0.0), MiniGridworld()]:
+        np_rand, _ = seeding.np_random(0)
+        ref_rand, _ = seeding.np_random(0)
+        world = QWorld(underlying, np_rand)
+        non_terms = [*underlying.nonterminal_states()]
+
+        state = world.reset()
+        assert state == non_terms[ref_rand.choice(len(non_terms), None)]
+
+        for i in range(TEST_POINTS):
+            action = underlying.actions[i % 4]
+            nxt, rewards, total, terminal = world.act(state, action)
+            assert nxt == reference_act(underlying, ref_rand, state, action)
+            assert rewards == {typ: vals[nxt] for typ, vals in underlying.rewards.items()}
+            assert total == underlying.total_reward[nxt]
+            assert terminal == underlying.terminals[nxt]
+
+            state = nxt
+            if terminal:
+                state = world.reset()
+                assert state == non_terms[ref_rand.choice(len(non_terms), None)]
+
+
+def test_act_misfire_rate():
+    np_rand, _ = seeding.np_random(0)
+    world = QWorld(Cliffworld(), np_rand)
+
+    misfires = sum(world.act((3, 2), 'd')[0] == (2, 2) for _ in range(TEST_POINTS * 10))
+    assert abs(misfires / (TEST_POINTS * 10) - 0.1) < 0.02
+
+    world = QWorld(Cliffworld(misfire_prob=0.0), np_rand)
+    assert all(world.act((3, 2), 'd')[0] == (3, 2) for _ in range(TEST_POINTS))
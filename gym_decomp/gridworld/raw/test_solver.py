@@ -0,0 +1,87 @@
+"""
+Test suite for the decomposed gridworld solver
+"""
+import numpy as np
+
+from gym_decomp.gridworld.raw.worlds import Cliffworld, MiniGridworld
+from gym_decomp.gridworld.raw import solver
+
+# We don't want to document every test
+# pylint: disable=C0111
+
+
+def loop_policy_evaluation(world, policy, gamma, sweeps=500):
+    """
+    The slow, by-hand version over `transition_prob` the solver replaces
+    """
+    q_values = {typ: {} for typ in world.rewards}
+    for typ, vals in world.rewards.items():
+        for _ in range(sweeps):
+            for state in world.states:
+                for a_idx, action in enumerate(world.actions):
+                    total = 0.0
+                    for nxt in world.successors(state, action):
+                        prob = world.transition_prob(state, action, nxt)
+                        future = 0.0
+                        if not world.terminals[nxt]:
+                            future = q_values[typ].get((nxt, policy[world.index_of(nxt)]), 0.0)
+                        total += prob * (vals[nxt] + gamma * future)
+                    q_values[typ][(state, a_idx)] = total
+    return q_values
+
+
+def test_policy_evaluation():
+    world = Cliffworld()
+    policy = np.array([(idx * 7) % 4 for idx in range(world.num_states)])
+
+    q_values = solver.policy_evaluation(world, policy, gamma=0.9)
+    assert q_values.shape == (len(world.rewards), world.num_states, 4)
+
+    expected = loop_policy_evaluation(world, policy, 0.9)
+    for c_idx, typ in enumerate(world.rewards):
+        for (state, a_idx), val in expected[typ].items():
+            assert abs(q_values[c_idx, world.index_of(state), a_idx] - val) < 1e-6
+
+
+def test_stochastic_policy():
+    world = Cliffworld()
+    policy = np.array([(idx * 3) % 4 for idx in range(world.num_states)])
+
+    onehot = np.eye(4)[policy]
+    assert np.allclose(solver.policy_evaluation(world, onehot),
+                       solver.policy_evaluation(world, policy))
+
+
+def test_value_iteration():
+    world = MiniGridworld()
+    q_values = solver.value_iteration(world, gamma=0.9)
+
+    # Stepping right onto the goal from (2, 0) is worth exactly the success reward
+    source = world.index_of((2, 0))
+    assert abs(q_values[0, source, 3] - 1.0) < 1e-8
+    assert abs(q_values[1, source, 3]) < 1e-8
+
+    policy = solver.greedy_policy(q_values)
+    assert policy[source] == 3
+    assert np.allclose(solver.policy_evaluation(world, policy, gamma=0.9), q_values)
+
+
+def test_value_iteration_optimal():
+    world = Cliffworld()
+    q_values = solver.value_iteration(world, gamma=0.9)
+    total = q_values.sum(axis=0)
+
+    # No policy beats the greedy one in any state
+    rng = np.random.RandomState(0)
+    for _ in range(20):
+        policy = rng.randint(4, size=world.num_states)
+        other = solver.policy_evaluation(world, policy, gamma=0.9).sum(axis=0)
+        assert (other.max(axis=-1) <= total.max(axis=-1) + 1e-8).all()
+
+
+def test_iteration_cap():
+    world = Cliffworld()
+    capped = solver.value_iteration(world, gamma=0.9, max_iter=1)
+
+    assert np.allclose(capped.sum(axis=0).reshape(-1),
+                       (world.transition_tensor @ world.state_total_rewards).reshape(-1))
@@ -5,5 +5,6 @@ these define *specific* instances of the gridworld.
 
 from gym_decomp.gridworld.raw.worlds.cliff import Cliffworld
 from gym_decomp.gridworld.raw.worlds.miniworld import MiniGridworld
+from gym_decomp.gridworld.raw.worlds.generated import GeneratedGridworld, generate
 
 ALL_WORLDS = [Cliffworld, MiniGridworld]
@@ -0,0 +1,54 @@
+import numpy as np
+from scipy import sparse
+
+from gym_decomp.gridworld.raw import Gridworld
+
+
+class GeneratedGridworld(Gridworld):
+    """
+    A randomly generated gridworld, for stress testing at scale.
+
+    Each reward type is placed on a `density` fraction of the tiles with a nonzero
+    integer reward in [-10, 10], and stored as a sparse COO matrix. Separately,
+    `wall_density` of the tiles are impassable, `terminal_density` of the remaining ones
+    end the episode and `misfire_density` of them may misfire in one random direction.
+    """
+
+    def __init__(self, shape, n_reward_types, density, seed=None, wall_density=0.1,
+                 terminal_density=0.01, misfire_density=0.0, misfire_prob=0.1):
+        rng = np.random.RandomState(seed)
+        shape = tuple(shape)
+        n_cells = int(np.prod(shape))
+
+        rewards = {}
+        n_rewards = int(round(density * n_cells))
+        for typ in range(n_reward_types):
+            cells = rng.choice(n_cells, n_rewards, replace=False)
+            vals = rng.randint(1, 11, size=n_rewards) * rng.choice([-1, 1], size=n_rewards)
+            rows, cols = np.unravel_index(cells, shape)
+            rewards["reward_%d" % typ] = sparse.coo_matrix(
+                (vals.astype(float), (rows, cols)), shape=shape)
+
+        impassable = rng.rand(*shape) < wall_density
+        # Keep at least one tile to start from
+        impassable.flat[rng.randint(n_cells)] = False
+
+        terminals = (rng.rand(*shape) < terminal_density) & ~impassable
+        if terminals.sum() == (~impassable).sum():
+            terminals[np.unravel_index(np.flatnonzero(~impassable)[0], shape)] = False
+
+        misfires = None
+        if misfire_density > 0:
+            misfires = np.full(shape, '', dtype='<U1')
+            misfiring = rng.rand(*shape) < misfire_density
+            misfires[misfiring] = rng.choice(['u', 'd', 'l', 'r'], size=misfiring.sum())
+
+        super().__init__(rewards, terminals, misfires, impassable, shape,
+                         "Generated%dx%d" % shape, misfire_prob=misfire_prob)
+
+
+def generate(shape, n_reward_types, density, seed=None, **kwargs):
+    """
+    Generates a random gridworld, see `GeneratedGridworld` for the options
+    """
+    return GeneratedGridworld(shape, n_reward_types, density, seed=seed, **kwargs)
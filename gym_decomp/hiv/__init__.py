@@ -16,18 +16,106 @@ from gym import spaces
 
 import numpy as np
 
+from gym_decomp.hiv import dynamics
+from gym_decomp.hiv.dynamics import decomposed_reward
+from gym_decomp.hiv.jit import JitHIVTreatment
+from gym_decomp.hiv.memo import TransitionMemo
+from gym_decomp.profiling import PhaseTimer
+
+# The keys of the dict reward decomposition, in the order of `HivSimV0.reward_types`
+DECOMPOSITION_KEYS = ["V: Free HI viruses",
+                      "RTI Side Effect",
+                      "PI Side Effect",
+                      "E: Cytotoxic T-lymphocytes (Immune Response)"]
+
+# The integrators `HivSimV0` can simulate the model with
+INTEGRATORS = ['reference', 'numba_rk4']
+
 
 class HivSimV0(gym.Env):
     """
     A thin wrapper over the HIVTreatment environment to conform to gym style.
 
     For more info on the environment see the original repository in the module documentation.
+
+    Each step integrates the model once and computes the reward decomposition once from the
+    new state, with `dynamics.decomposed_reward` (checked against the simulator's own
+    `typed_reward` by the tests). `info['reward_decomposition']` is a dict keyed like
+    `DECOMPOSITION_KEYS`, or with `array_decomposition=True` an array ordered like
+    `reward_types`.
+
+    Every `check_every` steps the decomposition is checked against the simulator's own
+    reward, logging a warning and flagging `info['warning_decomposition_mismatch']` if
+    they differ. `check_every=0` turns the check off.
+
+    `integrator` picks how the model is simulated: `'reference'` uses the upstream
+    `HIVTreatment` and its SciPy solver, `'numba_rk4'` uses the compiled RK4 in
+    `gym_decomp.hiv.jit`, which is much faster but only agrees with the reference to
+    within the error reported by `gym_decomp.hiv.accuracy`.
+
+    `get_state` and `set_state` snapshot and restore the simulation for branching.
+
+    With `memo_size > 0`, transitions are memoized in a `TransitionMemo` of that size keyed
+    on the state (quantized to `memo_tolerance` in log10) and the action, so repeated
+    queries skip the integration. See `memo` for the hit and miss counts.
+
+    With `profile=True`, the phases of `step` and `reset` are timed by a `PhaseTimer`
+    available as `profiler`.
     """
 
-    def __init__(self):
-        self.__world = HIVTreatment()
+    def __init__(self, array_decomposition=False, check_every=1, integrator='reference',
+                 memo_size=0, memo_tolerance=1e-6, profile=False):
+        if integrator == 'reference':
+            self.__world = HIVTreatment()
+        elif integrator == 'numba_rk4':
+            self.__world = JitHIVTreatment()
+        else:
+            raise ValueError("Unknown integrator %s, expected one of %s"
+                             % (integrator, INTEGRATORS))
+
+        self.__integrator = integrator
+        self.__array_decomposition = array_decomposition
+        self.__check_every = check_every
+        self.__unchecked_steps = 0
+        self.__memo = TransitionMemo(memo_size, memo_tolerance) if memo_size else None
+        self.__profiler = PhaseTimer() if profile else None
         self.action_space = spaces.Discrete(4)
 
+    @property
+    def memo(self):
+        """
+        The `TransitionMemo` of this environment, or None if memoization is off
+        """
+        return self.__memo
+
+    @property
+    def profiler(self):
+        """
+        The `PhaseTimer` timing `step` (phases `memo` when memoizing, `integrate` or
+        `memo_hit`, `reward`, `decomposition` and `check`) and `reset`, or None if
+        profiling is off
+        """
+        return self.__profiler
+
+    @property
+    def integrator(self):
+        """
+        The name of the integrator simulating the model, one of `INTEGRATORS`
+        """
+        return self.__integrator
+
+    @property
+    def array_decomposition(self):
+        """
+        Whether the reward decomposition is given as an array in the order of `reward_types`
+        (as opposed to a dict)
+        """
+        return self.__array_decomposition
+
+    @array_decomposition.setter
+    def array_decomposition(self, val):
+        self.__array_decomposition = val
+
     @property
     def state_meanings(self):
         """
@@ -58,37 +146,166 @@ class HivSimV0(gym.Env):
                 "E: Cytotoxic T-lymphocytes (Immune Response)"]
 
     def reset(self):
+        profiler = self.__profiler
+        if profiler:
+            profiler.start()
+
         self.__world.reset()
-        return self.__world.observe()
+        obs = self.__world.observe()
+        if profiler:
+            profiler.lap('reset')
+
+        return obs
 
     def step(self, action):
-        reward, nxt = self.__world.perform_action(action)
-        # In the code for perform_action, the total reward is calculated after the updates
-        # So this is proper
-        typed_reward = self.__world.typed_reward(action)
-        typed_reward['RTI Side Effect'] = typed_reward["Episode value 1"]
-        typed_reward['PI Side Effect'] = typed_reward["Episode value 2"]
-        typed_reward.pop("Episode value 1")
-        typed_reward.pop("Episode value 2")
+        profiler = self.__profiler
+        if profiler:
+            profiler.start()
+
+        cached = None
+        if self.__memo is not None:
+            key = self.__memo.key(self.__world.state, action)
+            cached = self.__memo.get(key)
+            if profiler:
+                profiler.lap('memo')
+
+        if cached is None:
+            # In the code for perform_action, the total reward is calculated after the updates
+            # So the decomposition of the new state is proper
+            reward, nxt = self.__world.perform_action(action)
+            if profiler:
+                profiler.lap('integrate')
+
+            typed_reward = decomposed_reward(nxt, action)
+            if self.__memo is not None:
+                self.__memo.put(key, (self.__world.state.copy(), reward, typed_reward.copy()))
+            if profiler:
+                profiler.lap('reward')
+        else:
+            state, reward, typed_reward = cached
+            self.__world.state = state.copy()
+            self.__world.t += 1
+            nxt = self.__world.observe()
+            typed_reward = typed_reward.copy()
+            if profiler:
+                profiler.lap('memo_hit')
 
         terminal = self.__world.is_done()
+        if self.__array_decomposition:
+            info = {'reward_decomposition': typed_reward}
+        else:
+            typed_reward = [round(float(val), 3) for val in typed_reward]
+            info = {'reward_decomposition': dict(zip(DECOMPOSITION_KEYS, typed_reward))}
+        if profiler:
+            profiler.lap('decomposition')
+
+        if self.__check_every:
+            self.__unchecked_steps += 1
+            if self.__unchecked_steps >= self.__check_every:
+                self.__unchecked_steps = 0
+                self.__check_decomposition(reward, info)
+            if profiler:
+                profiler.lap('check')
 
-        info = {'reward_decomposition': typed_reward}
+        return nxt, reward, terminal, info
 
-        reward_sum = 0
-        for k in typed_reward.keys():
-            typed_reward[k] = round(typed_reward[k],3)
-            reward_sum += typed_reward[k]
+    @staticmethod
+    def __check_decomposition(reward, info):
+        typed_reward = info['reward_decomposition']
+        if isinstance(typed_reward, dict):
+            reward_sum = sum(typed_reward.values())
+        else:
+            reward_sum = typed_reward.sum()
 
         if reward_sum - reward > 1e-8 or np.isnan(reward_sum):
             logging.warning("Warning, HIV Decomposition =/= returned reward:\nReward: %f\n\
             Decomposition: %s (sum: %f)\n", reward, typed_reward, reward_sum)
             info['warning_decomposition_mismatch'] = True
 
-        return nxt, reward, terminal, info
+    def get_state(self):
+        """
+        A snapshot of the simulation: the raw 6-state vector and the step count of the episode
+        """
+        return self.__world.state.copy(), self.__world.t
+
+    def set_state(self, snapshot):
+        """
+        Restores a snapshot taken by `get_state`, returning the observation of its state
+        """
+        state, self.__world.t = snapshot
+        self.__world.state = np.array(state, dtype=float)
+        return self.__world.observe()
 
     def render(self, mode=None):
         if mode == 'print':
             obs = self.__world.observe()
             return "\n".join([self.state_meanings[i].split(":")[0] + ": " + str(round(obs[i],3)) for i in range(len(obs))])
         return self.__world.observe()
+
+
+class HivBatchSimV0(object):
+    """
+    Simulates `num_envs` patients of the HIV treatment model at once, keeping all of their
+    states in one `(num_envs, 6)` matrix and integrating them together with the vectorized
+    solver in `gym_decomp.hiv.dynamics`.
+
+    Every patient starts in the same state and episodes have a fixed length, so all
+    patients finish at the same time.
+
+    Observation Space: An `(num_envs, 6)` array of log10 cell counts, like `HivSimV0`
+    Action Space: `Discrete(4)` for each patient, pass an `(num_envs,)` integer array to `step`
+    """
+
+    state_meanings = HivSimV0.state_meanings
+    action_meanings = HivSimV0.action_meanings
+    reward_types = HivSimV0.reward_types
+
+    def __init__(self, num_envs, courant=1.0, min_substeps=25):
+        self.__num_envs = num_envs
+        self.__courant = courant
+        self.__min_substeps = min_substeps
+        self.__states = None
+        self.__t = 0
+        self.action_space = spaces.Discrete(4)
+
+    @property
+    def num_envs(self):
+        """
+        The number of patients stepped by each call
+        """
+        return self.__num_envs
+
+    @property
+    def states(self):
+        """
+        The raw (not log10) `(num_envs, 6)` state matrix
+        """
+        return self.__states
+
+    def reset(self):
+        self.__t = 0
+        self.__states = np.tile(dynamics.INITIAL_STATE, (self.num_envs, 1))
+        return np.log10(self.__states)
+
+    def step(self, actions):
+        """
+        Takes one action per patient, given as an `(num_envs,)` integer array.
+
+        Returns the `(num_envs, 6)` observations, `(num_envs,)` rewards and terminal flags,
+        and an info dict whose `reward_decomposition` is a `(num_envs, 4)` array in the order
+        of `reward_types`.
+        """
+        actions = np.asarray(actions)
+        self.__states = dynamics.integrate(self.__states, actions, courant=self.__courant,
+                                           min_substeps=self.__min_substeps)
+        self.__t += 1
+
+        obs = np.log10(self.__states)
+        typed_reward = decomposed_reward(obs, actions)
+        reward = typed_reward.sum(axis=1)
+        terminal = np.full(self.num_envs, self.__t >= dynamics.EPISODE_LENGTH)
+
+        return obs, reward, terminal, {'reward_decomposition': typed_reward}
+
+    def close(self):
+        pass
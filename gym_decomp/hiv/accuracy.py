@@ -0,0 +1,93 @@
+"""
+Compares the compiled RK4 integrator of `gym_decomp.hiv.jit` against the reference
+`HIVTreatment` over a set of standard treatment schedules.
+
+Run `python -m gym_decomp.hiv.accuracy` to print the report.
+"""
+import time
+
+from hiv_simulator.hiv import HIVTreatment
+import numpy as np
+
+from gym_decomp.hiv import dynamics
+from gym_decomp.hiv.jit import JitHIVTreatment
+
+
+def _interrupted(on_steps, off_steps):
+    period = on_steps + off_steps
+    return [3 if step % period < on_steps else 0 for step in range(dynamics.EPISODE_LENGTH)]
+
+
+# Action sequences covering the regimes of the model: the untreated steady state, full
+# treatment, each drug alone, structured treatment interruptions (where the model is
+# stiffest, as the virus rebounds) and a random schedule
+STANDARD_SCHEDULES = {
+    'no treatment': [0] * dynamics.EPISODE_LENGTH,
+    'RTI only': [1] * dynamics.EPISODE_LENGTH,
+    'PI only': [2] * dynamics.EPISODE_LENGTH,
+    'RTI & PI': [3] * dynamics.EPISODE_LENGTH,
+    'interrupted 5 on/5 off': _interrupted(5, 5),
+    'interrupted 30 on/30 off': _interrupted(30, 30),
+    'random': list(np.random.RandomState(0).randint(4, size=dynamics.EPISODE_LENGTH)),
+}
+
+
+def _run(world, schedule):
+    world.reset()
+    observations, rewards = [], []
+    start = time.perf_counter()
+    for action in schedule:
+        reward, obs = world.perform_action(action)
+        observations.append(obs)
+        rewards.append(reward)
+    elapsed = time.perf_counter() - start
+    return np.array(observations), np.array(rewards), len(schedule) / elapsed
+
+
+def accuracy_report(schedules=None, courant=1.0, min_substeps=25):
+    """
+    Runs each schedule (a dict of name to action sequence, `STANDARD_SCHEDULES` by default)
+    through both integrators, and returns a dict of name to:
+
+    - `max_obs_error`: the largest absolute difference of any log10 observation
+    - `max_reward_error`: the largest relative difference of any step's reward
+    - `return_error`: the relative difference of the undiscounted return
+    - `reference_steps_per_sec` and `numba_steps_per_sec`
+    """
+    schedules = STANDARD_SCHEDULES if schedules is None else schedules
+    reference = HIVTreatment()
+    compiled = JitHIVTreatment(courant=courant, min_substeps=min_substeps)
+    # Leave the JIT compilation out of the timings
+    compiled.perform_action(0)
+
+    report = {}
+    for name, schedule in schedules.items():
+        ref_obs, ref_rewards, ref_speed = _run(reference, schedule)
+        obs, rewards, speed = _run(compiled, schedule)
+
+        report[name] = {
+            'max_obs_error': float(np.abs(obs - ref_obs).max()),
+            'max_reward_error': float((np.abs(rewards - ref_rewards) / np.abs(ref_rewards)).max()),
+            'return_error': float(abs(rewards.sum() - ref_rewards.sum()) / abs(ref_rewards.sum())),
+            'reference_steps_per_sec': ref_speed,
+            'numba_steps_per_sec': speed,
+        }
+    return report
+
+
+def format_report(report):
+    """
+    Formats the result of `accuracy_report` as a table
+    """
+    header = "%-26s %14s %16s %12s %14s %14s" % ("schedule", "max obs error", "max reward error",
+                                                  "return error", "reference/s", "numba_rk4/s")
+    lines = [header, "-" * len(header)]
+    for name, row in report.items():
+        lines.append("%-26s %14.2e %16.2e %12.2e %14.0f %14.0f" % (
+            name, row['max_obs_error'], row['max_reward_error'], row['return_error'],
+            row['reference_steps_per_sec'], row['numba_steps_per_sec']))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    print(format_report(accuracy_report()))
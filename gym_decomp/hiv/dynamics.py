@@ -0,0 +1,144 @@
+"""
+A NumPy port of the 6-state HIV treatment model simulated by `hiv_simulator.hiv.HIVTreatment`
+(Adams et al. 2004, as used by Ernst et al. 2006), vectorized over any number of patients.
+
+States are raw concentrations in the order the model unpacks them:
+T1, T2, T1*, T2*, V, E. Observations are their log10, like `HIVTreatment.observe`.
+"""
+import numpy as np
+
+# Days simulated per action, and actions per episode
+DT = 5.0
+EPISODE_LENGTH = 200
+
+# The non-healthy stable state every patient starts in
+INITIAL_STATE = np.array([163573., 5., 11945., 46., 63919., 24.])
+
+# The (RTI, PI) efficacy of each action
+ACTION_EFFICACIES = np.array([[0., 0.], [.7, 0.], [0., .3], [.7, .3]])
+
+# Model parameters
+LAMBDA1 = 1e4  # Target cell type 1 production (source) rate
+LAMBDA2 = 31.98  # Target cell type 2 production (source) rate
+D1 = 0.01  # Target cell type 1 death rate
+D2 = 0.01  # Target cell type 2 death rate
+F = .34  # Treatment efficacy reduction for type 2 cells
+K1 = 8e-7  # Population 1 infection rate
+K2 = 1e-4  # Population 2 infection rate
+DELTA = .7  # Infected cell death rate
+M1 = 1e-5  # Immune-induced clearance rate for population 1
+M2 = 1e-5  # Immune-induced clearance rate for population 2
+NT = 100.  # Virions produced per infected cell
+C = 13.  # Virus natural death rate
+RHO1 = 1.  # Average number of virions infecting a type 1 cell
+RHO2 = 1.  # Average number of virions infecting a type 2 cell
+LAMBDA_E = 1.  # Immune effector production (source) rate
+B_E = 0.3  # Maximum birth rate for immune effectors
+K_B = 100.  # Saturation constant for immune effector birth
+D_E = 0.25  # Maximum death rate for immune effectors
+K_D = 500.  # Saturation constant for immune effector death
+DELTA_E = 0.1  # Natural death rate for immune effectors
+
+
+def compartment_rates(t1, t2, t1s, t2s, v, e, eps1, eps2):
+    """
+    The time derivatives of the six compartments, elementwise over scalars or arrays of the
+    compartments and of the RTI and PI efficacies.
+
+    This is the one definition of the model: `gym_decomp.hiv.jit` compiles it with numba as
+    is, so it only uses arithmetic that NumPy and numba both support.
+    """
+    infect1 = (1. - eps1) * K1 * v * t1
+    infect2 = (1. - F * eps1) * K2 * v * t2
+    infected = t1s + t2s
+
+    return (LAMBDA1 - D1 * t1 - infect1,
+            LAMBDA2 - D2 * t2 - infect2,
+            infect1 - DELTA * t1s - M1 * e * t1s,
+            infect2 - DELTA * t2s - M2 * e * t2s,
+            (1. - eps2) * NT * DELTA * infected - C * v
+            - ((1. - eps1) * RHO1 * K1 * t1 + (1. - F * eps1) * RHO2 * K2 * t2) * v,
+            LAMBDA_E + B_E * infected / (infected + K_B) * e
+            - D_E * infected / (infected + K_D) * e - DELTA_E * e)
+
+
+def compartment_decay_rate(t1, t2, v, e, eps1):
+    """
+    The fastest per-day loss rate of any compartment, elementwise like `compartment_rates`
+    """
+    return np.maximum(np.maximum(D1 + (1. - eps1) * K1 * v,
+                                 D2 + (1. - F * eps1) * K2 * v),
+                      np.maximum(DELTA + max(M1, M2) * e,
+                                 C + (1. - eps1) * RHO1 * K1 * t1
+                                 + (1. - F * eps1) * RHO2 * K2 * t2))
+
+
+def derivatives(states, eps1, eps2):
+    """
+    The time derivative of an `(N, 6)` array of states, given `(N,)` arrays (or scalars)
+    of RTI and PI efficacies
+    """
+    return np.stack(compartment_rates(*states.T, eps1, eps2), axis=-1)
+
+
+def decay_rate(states, eps1):
+    """
+    The fastest per-day loss rate of any compartment in each of an `(N, 6)` array of states.
+
+    The model is stiff (e.g. T2 is depleted at about `K2 * V` per day, which passes 80 when
+    treatment stops), so explicit steps have to stay well under `1 / decay_rate` to be stable.
+    """
+    t1, t2, _, _, v, e = states.T
+    return compartment_decay_rate(t1, t2, v, e, eps1)
+
+
+def integrate(states, actions, dt=DT, courant=1.0, min_substeps=25):
+    """
+    Integrates an `(N, 6)` array of states over `dt` days under an `(N,)` array of actions
+    with the classic Runge-Kutta method, advancing every patient in the same vectorized
+    calls.
+
+    Each patient takes steps of at most `dt / min_substeps` days, and at most `courant`
+    divided by its current `decay_rate`. Stiff patients take more, smaller steps while
+    the rest keep the larger ones.
+    """
+    eps1, eps2 = ACTION_EFFICACIES[actions].T
+    states = np.array(states, dtype=float)
+    remaining = np.full(len(states), float(dt))
+    active = np.arange(len(states))
+
+    while len(active):
+        curr, e1, e2 = states[active], eps1[active], eps2[active]
+        step = np.minimum(remaining[active],
+                          np.minimum(dt / min_substeps, courant / decay_rate(curr, e1)))
+        step_col = step[:, None]
+
+        k1 = derivatives(curr, e1, e2)
+        k2 = derivatives(curr + 0.5 * step_col * k1, e1, e2)
+        k3 = derivatives(curr + 0.5 * step_col * k2, e1, e2)
+        k4 = derivatives(curr + step_col * k3, e1, e2)
+        states[active] = curr + step_col / 6. * (k1 + 2. * k2 + 2. * k3 + k4)
+
+        # Snap the last step of each patient onto `dt` exactly
+        left = remaining[active] - step
+        remaining[active] = np.where(left > 1e-9 * dt, left, 0.)
+        active = active[remaining[active] > 0]
+
+    return states
+
+
+def decomposed_reward(obs, actions):
+    """
+    The reward components (V, RTI side effect, PI side effect, E) for arriving at the
+    log10 observations `obs` after taking `actions`.
+
+    Works on a single `(6,)` observation and action, or on `(N, 6)` observations and
+    `(N,)` actions, giving `(4,)` or `(N, 4)` components. This is the same linear
+    combination `HIVTreatment` sums into its reward.
+    """
+    obs = np.asarray(obs)
+    eps1, eps2 = np.moveaxis(ACTION_EFFICACIES[actions], -1, 0)
+    return np.stack([-0.1 * 10 ** obs[..., 4],
+                     np.broadcast_to(-2e4 * eps1 ** 2, obs.shape[:-1]),
+                     np.broadcast_to(-2e3 * eps2 ** 2, obs.shape[:-1]),
+                     1e3 * 10 ** obs[..., 5]], axis=-1)
@@ -0,0 +1,102 @@
+"""
+A numba-compiled, single-patient version of the integrator in `gym_decomp.hiv.dynamics`,
+and a drop-in replacement for `HIVTreatment` built on it.
+"""
+import numba
+import numpy as np
+
+from gym_decomp.hiv import dynamics
+from gym_decomp.hiv.dynamics import decomposed_reward
+
+# The model itself, compiled from its one definition in `dynamics`
+_compartment_rates = numba.njit(cache=True)(dynamics.compartment_rates)
+_compartment_decay_rate = numba.njit(cache=True)(dynamics.compartment_decay_rate)
+
+
+@numba.njit(cache=True)
+def _derivatives(s, eps1, eps2, out):
+    rates = _compartment_rates(s[0], s[1], s[2], s[3], s[4], s[5], eps1, eps2)
+    for i in range(6):
+        out[i] = rates[i]
+
+
+@numba.njit(cache=True)
+def _decay_rate(s, eps1):
+    return _compartment_decay_rate(s[0], s[1], s[4], s[5], eps1)
+
+
+@numba.njit(cache=True)
+def integrate(state, eps1, eps2, dt, courant, min_substeps):
+    """
+    Integrates one `(6,)` state over `dt` days with the same stability-limited RK4 scheme
+    as `dynamics.integrate`
+    """
+    s = state.copy()
+    k1, k2, k3, k4 = np.empty(6), np.empty(6), np.empty(6), np.empty(6)
+    tmp = np.empty(6)
+
+    remaining = dt
+    while remaining > 0:
+        step = min(remaining, dt / min_substeps, courant / _decay_rate(s, eps1))
+
+        _derivatives(s, eps1, eps2, k1)
+        for i in range(6):
+            tmp[i] = s[i] + 0.5 * step * k1[i]
+        _derivatives(tmp, eps1, eps2, k2)
+        for i in range(6):
+            tmp[i] = s[i] + 0.5 * step * k2[i]
+        _derivatives(tmp, eps1, eps2, k3)
+        for i in range(6):
+            tmp[i] = s[i] + step * k3[i]
+        _derivatives(tmp, eps1, eps2, k4)
+        for i in range(6):
+            s[i] += step / 6. * (k1[i] + 2. * k2[i] + 2. * k3[i] + k4[i])
+
+        # Snap the last step onto `dt` exactly
+        remaining -= step
+        if remaining <= 1e-9 * dt:
+            remaining = 0.
+
+    return s
+
+
+class JitHIVTreatment(object):
+    """
+    Stands in for `hiv_simulator.hiv.HIVTreatment` (`reset`, `observe`, `perform_action`,
+    `typed_reward` and `is_done`), but integrates with the compiled fixed-scheme RK4 instead
+    of SciPy's adaptive BDF solver. See `gym_decomp.hiv.accuracy` for how far the two drift
+    apart.
+    """
+
+    def __init__(self, courant=1.0, min_substeps=25):
+        self.courant = courant
+        self.min_substeps = min_substeps
+        self.t = 0
+        self.state = None
+        self.reset()
+
+    def reset(self):
+        self.t = 0
+        self.state = dynamics.INITIAL_STATE.copy()
+
+    def observe(self):
+        return np.log10(self.state)
+
+    def is_done(self, episode_length=dynamics.EPISODE_LENGTH):
+        return self.t >= episode_length
+
+    def typed_reward(self, action=0):
+        v_reward, rti_reward, pi_reward, e_reward = decomposed_reward(self.observe(), action)
+        return {"V: Free HI viruses": float(v_reward),
+                "Episode value 1": float(rti_reward),
+                "Episode value 2": float(pi_reward),
+                "E: Cytotoxic T-lymphocytes (Immune Response)": float(e_reward)}
+
+    def perform_action(self, action):
+        self.t += 1
+        eps1, eps2 = dynamics.ACTION_EFFICACIES[action]
+        self.state = integrate(self.state, eps1, eps2, dynamics.DT,
+                               self.courant, self.min_substeps)
+
+        obs = self.observe()
+        return float(decomposed_reward(obs, action).sum()), obs
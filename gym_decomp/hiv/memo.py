@@ -0,0 +1,102 @@
+"""
+A bounded memo of HIV model transitions, keyed on a quantized state and an action.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+# States are clamped to this before taking their log10, so zero or negative populations
+# (e.g. after an integration undershoot) still get a finite key
+_MIN_STATE = np.finfo(float).tiny
+
+
+class TransitionMemo(object):
+    """
+    A least-recently-used cache of up to `max_size` transitions.
+
+    States are keyed on their log10 rounded to multiples of `tolerance`, so states within
+    about `tolerance` (in log10, i.e. a relative difference of roughly `2.3 * tolerance`)
+    share an entry and get the transition cached for whichever of them came first.
+    `tolerance=0` only matches identical states. Populations at or below zero all share
+    the key of the smallest positive float.
+    """
+
+    def __init__(self, max_size=4096, tolerance=1e-6):
+        if max_size <= 0:
+            raise ValueError("Memo size must be positive, got %s" % max_size)
+
+        self.__max_size = max_size
+        self.__tolerance = tolerance
+        self.__entries = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def max_size(self):
+        """
+        The most transitions kept before evicting the least recently used
+        """
+        return self.__max_size
+
+    @property
+    def tolerance(self):
+        """
+        The log10 quantization step of the state keys
+        """
+        return self.__tolerance
+
+    @property
+    def hits(self):
+        """
+        How many lookups found a cached transition
+        """
+        return self.__hits
+
+    @property
+    def misses(self):
+        """
+        How many lookups found nothing
+        """
+        return self.__misses
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def key(self, state, action):
+        """
+        The memo key of taking `action` in the raw 6-state vector `state`
+        """
+        state = np.asarray(state, dtype=float)
+        if self.__tolerance:
+            state = np.log10(np.maximum(state, _MIN_STATE))
+            state = np.round(state / self.__tolerance).astype(np.int64)
+        return state.tobytes(), int(action)
+
+    def get(self, key):
+        """
+        The transition cached under `key`, or None, counting a hit or a miss
+        """
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.__misses += 1
+        else:
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Caches a transition, evicting the least recently used one if the memo is full
+        """
+        self.__entries[key] = entry
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drops every cached transition and resets the counters
+        """
+        self.__entries.clear()
+        self.__hits = 0
+        self.__misses = 0
@@ -0,0 +1,80 @@
+"""
+Scoring open-loop treatment plans (fixed action sequences) on `HivSimV0`.
+
+The dynamics are deterministic given the actions, so plans sharing a prefix share the states
+along it. `PlanEvaluator` stores a batch of plans in a trie and simulates each shared
+prefix once, branching with `HivSimV0.get_state`/`set_state`.
+"""
+import numpy as np
+
+from gym_decomp.hiv import HivSimV0
+
+
+def _build_trie(plans):
+    # Each node is (children by action, indices of the plans ending here)
+    root = ({}, [])
+    for idx, plan in enumerate(plans):
+        node = root
+        for action in plan:
+            node = node[0].setdefault(int(action), ({}, []))
+        node[1].append(idx)
+    return root
+
+
+class PlanEvaluator(object):
+    """
+    Computes the decomposed (discounted) return of many treatment plans, simulating every
+    distinct prefix only once.
+
+    `integrator` is passed on to `HivSimV0`.
+    """
+
+    def __init__(self, gamma=1.0, integrator='reference'):
+        self.__gamma = gamma
+        self.__env = HivSimV0(array_decomposition=True, check_every=0, integrator=integrator)
+        self.__simulated_steps = 0
+
+    @property
+    def reward_types(self):
+        """
+        The reward types, in the order of the returned components
+        """
+        return self.__env.reward_types
+
+    @property
+    def simulated_steps(self):
+        """
+        The number of model steps simulated by the last call to `evaluate`
+        """
+        return self.__simulated_steps
+
+    def evaluate(self, plans, start=None):
+        """
+        Returns a `(len(plans), len(reward_types))` array with the decomposed return of each
+        plan, i.e. the sum of its discounted reward decompositions.
+
+        Each plan is a sequence of actions, simulated from the start of an episode or from a
+        `start` snapshot taken by `HivSimV0.get_state`.
+        """
+        returns = np.zeros((len(plans), len(self.reward_types)))
+        self.__simulated_steps = 0
+
+        if start is None:
+            self.__env.reset()
+            start = self.__env.get_state()
+
+        stack = [(_build_trie(plans), start, np.zeros(len(self.reward_types)), 1.0)]
+        while stack:
+            (children, ends), snapshot, prefix_return, discount = stack.pop()
+            returns[ends] = prefix_return
+
+            for action, child in children.items():
+                self.__env.set_state(snapshot)
+                _, _, _, info = self.__env.step(action)
+                self.__simulated_steps += 1
+
+                stack.append((child, self.__env.get_state(),
+                              prefix_return + discount * info['reward_decomposition'],
+                              discount * self.__gamma))
+
+        return returns
@@ -0,0 +1,92 @@
+"""
+Low-overhead per-phase timing of environment steps.
+
+Environments made with `profile=True` keep a `PhaseTimer` in their `profiler` property
+and time each phase of `step` and `reset` with it. Without it `profiler` is None and
+the only cost is a check of it per phase.
+"""
+import bisect
+import time
+
+# The upper edges of the histogram bins, in seconds: 1us, 2us, 4us, ... up to about 8s,
+# with a final bin for anything slower
+BIN_EDGES = [1e-6 * 2 ** exp for exp in range(24)]
+
+
+class PhaseTimer(object):
+    """
+    Times consecutive phases of some code:
+
+        timer.start()
+        ...
+        timer.lap('first phase')
+        ...
+        timer.lap('second phase')
+
+    Each lap records the time since the last `start` or `lap` under the phase name, in a
+    count, a total, the extremes and a histogram over `BIN_EDGES`.
+    """
+
+    def __init__(self):
+        self.__phases = {}
+        self.__last = None
+
+    def start(self):
+        """
+        Starts timing the first phase
+        """
+        self.__last = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Ends the current phase, recording its time under `phase`, and starts the next one
+        """
+        now = time.perf_counter()
+        elapsed = now - self.__last
+        self.__last = now
+
+        record = self.__phases.get(phase)
+        if record is None:
+            record = self.__phases[phase] = [0, 0.0, elapsed, elapsed, [0] * (len(BIN_EDGES) + 1)]
+        record[0] += 1
+        record[1] += elapsed
+        if elapsed < record[2]:
+            record[2] = elapsed
+        if elapsed > record[3]:
+            record[3] = elapsed
+        record[4][bisect.bisect_left(BIN_EDGES, elapsed)] += 1
+
+    def reset(self):
+        """
+        Forgets every recorded time
+        """
+        self.__phases.clear()
+
+    def stats(self):
+        """
+        A dict of phase name to its `count`, `total_sec`, `mean_sec`, `min_sec`, `max_sec`,
+        the `p50_sec` and `p99_sec` estimated from the histogram (as the upper edge of the bin
+        they fall in), and the `histogram` counts themselves
+        """
+        stats = {}
+        for phase, (count, total, fastest, slowest, histogram) in self.__phases.items():
+            stats[phase] = {
+                'count': count,
+                'total_sec': total,
+                'mean_sec': total / count,
+                'min_sec': fastest,
+                'max_sec': slowest,
+                'p50_sec': self.__percentile(histogram, count, 0.5, slowest),
+                'p99_sec': self.__percentile(histogram, count, 0.99, slowest),
+                'histogram': [*histogram],
+            }
+        return stats
+
+    @staticmethod
+    def __percentile(histogram, count, quantile, slowest):
+        seen = 0
+        for idx, bin_count in enumerate(histogram):
+            seen += bin_count
+            if seen >= quantile * count:
+                return min(BIN_EDGES[idx], slowest) if idx < len(BIN_EDGES) else slowest
+        return slowest
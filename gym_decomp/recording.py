@@ -0,0 +1,278 @@
+"""
+Streams the transitions of any gym_decomp environment to disk, for offline analysis.
+
+Transitions are written column by column into preallocated `.npy` memory maps, in chunks of
+about a fixed number of bytes. Full chunks are flushed by a background thread, and a
+`manifest.json` lists the finished ones, so a recording can be read back (as memory maps,
+without copying) while it is still growing.
+
+The columns are `obs` (or `obs/<key>` for dict observations), `action`, `reward`, `terminal`
+and `reward/<reward type>` for each of the environment's `reward_types`. Each row holds the
+observation an action was taken in, with the reward and terminal flag it led to.
+"""
+import json
+import queue
+import threading
+from pathlib import Path
+
+import gym
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from gym_decomp.util import write_json_atomic
+
+MANIFEST_FILE = "manifest.json"
+
+# The default size of a chunk, summed over its columns
+DEFAULT_CHUNK_BYTES = 64 * 2 ** 20
+
+
+def _copy_obs(obs):
+    if isinstance(obs, dict):
+        return {key: np.array(val, copy=True) for key, val in obs.items()}
+    return np.array(obs, copy=True)
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    """
+    Records every transition of `env` to `directory`, in chunks of as many transitions as
+    fit in `chunk_bytes` (at least one), or at most `chunk_size` transitions if given.
+
+    The environment is switched to `array_decomposition`, so its `info['reward_decomposition']`
+    is an array ordered like `reward_types`. Call `close` to write out the last, partial
+    chunk, which is cut down to the transitions it holds.
+
+    Observations are copied when they are returned, so environments that update one
+    observation buffer in place (e.g. gridworlds with `obs_buffer=True`) are recorded
+    correctly.
+
+    If writing a chunk fails (e.g. the disk is full), the error is raised again by every
+    later `step` and `flush`, and by `close` once everything is shut down.
+    """
+
+    def __init__(self, env, directory, chunk_bytes=DEFAULT_CHUNK_BYTES, chunk_size=None):
+        super().__init__(env)
+        env.unwrapped.array_decomposition = True
+
+        self.__directory = Path(directory)
+        self.__directory.mkdir(parents=True, exist_ok=True)
+        self.__chunk_bytes = chunk_bytes
+        self.__max_chunk_size = chunk_size
+        self.__chunk_size = None
+        self.__reward_types = [*env.unwrapped.reward_types]
+
+        self.__columns = None
+        self.__chunk = None
+        self.__num_chunks = 0
+        self.__row = 0
+        self.__last_obs = None
+        self.__manifest = {'chunk_size': None, 'reward_types': self.__reward_types,
+                           'columns': {}, 'chunks': []}
+
+        self.__error = None
+        self.__jobs = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def directory(self):
+        """
+        Where the recording is written
+        """
+        return self.__directory
+
+    @property
+    def chunk_size(self):
+        """
+        The number of transitions in a full chunk, or None until the first step
+        """
+        return self.__chunk_size
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        self.__last_obs = _copy_obs(obs)
+        return obs
+
+    def step(self, action):
+        if self.__last_obs is None:
+            raise Exception("Cannot step before the environment is reset")
+        self.__raise_error()
+        obs, reward, terminal, info = self.env.step(action)
+
+        if self.__columns is None:
+            self.__columns = self.__describe_columns(self.__last_obs, action)
+        if self.__chunk is None:
+            self.__chunk = self.__new_chunk()
+
+        row, chunk = self.__row, self.__chunk
+        if isinstance(self.__last_obs, dict):
+            for key, val in self.__last_obs.items():
+                chunk['obs/%s' % key][row] = val
+        else:
+            chunk['obs'][row] = self.__last_obs
+        chunk['action'][row] = action
+        chunk['reward'][row] = reward
+        chunk['terminal'][row] = terminal
+        for r_type, val in zip(self.__reward_types, info['reward_decomposition']):
+            chunk['reward/%s' % r_type][row] = val
+
+        self.__row += 1
+        if self.__row == self.__chunk_size:
+            self.__finish_chunk()
+
+        self.__last_obs = _copy_obs(obs)
+        return obs, reward, terminal, info
+
+    def flush(self):
+        """
+        Waits until every full chunk is written out
+        """
+        self.__jobs.join()
+        self.__raise_error()
+
+    def close(self):
+        if self.__chunk is not None:
+            self.__finish_chunk()
+        self.__jobs.put(None)
+        self.__thread.join()
+        result = self.env.close()
+        self.__raise_error()
+        return result
+
+    def __raise_error(self):
+        if self.__error is not None:
+            raise Exception("Failed to write the recording to %s" % self.__directory) \
+                from self.__error
+
+    def __describe_columns(self, obs, action):
+        columns = {}
+        if isinstance(obs, dict):
+            for key, val in obs.items():
+                val = np.asarray(val)
+                columns['obs/%s' % key] = (val.shape, val.dtype)
+        else:
+            obs = np.asarray(obs)
+            columns['obs'] = (obs.shape, obs.dtype)
+
+        columns['action'] = (np.shape(action), np.asarray(action).dtype)
+        columns['reward'] = ((), np.dtype(np.float64))
+        columns['terminal'] = ((), np.dtype(np.bool_))
+        for r_type in self.__reward_types:
+            columns['reward/%s' % r_type] = ((), np.dtype(np.float64))
+
+        for idx, (name, (shape, dtype)) in enumerate(columns.items()):
+            self.__manifest['columns'][name] = {'file': "col_%d.npy" % idx,
+                                                'shape': [*shape],
+                                                'dtype': dtype.str}
+
+        row_bytes = sum(int(np.prod(shape)) * dtype.itemsize for shape, dtype in columns.values())
+        self.__chunk_size = max(self.__chunk_bytes // row_bytes, 1)
+        if self.__max_chunk_size is not None:
+            self.__chunk_size = min(self.__chunk_size, self.__max_chunk_size)
+        self.__manifest['chunk_size'] = self.__chunk_size
+        return columns
+
+    def __new_chunk(self):
+        chunk_dir = self.__directory / ("chunk_%05d" % self.__num_chunks)
+        chunk_dir.mkdir(exist_ok=True)
+
+        chunk = {}
+        for name, (shape, dtype) in self.__columns.items():
+            path = chunk_dir / self.__manifest['columns'][name]['file']
+            chunk[name] = open_memmap(str(path), mode='w+', dtype=dtype,
+                                      shape=(self.__chunk_size,) + shape)
+        return chunk
+
+    def __finish_chunk(self):
+        self.__jobs.put((self.__chunk, "chunk_%05d" % self.__num_chunks, self.__row))
+        self.__chunk = None
+        self.__num_chunks += 1
+        self.__row = 0
+
+    def __run(self):
+        while True:
+            job = self.__jobs.get()
+            try:
+                if job is None:
+                    return
+
+                chunk, name, length = job
+                for column_name in [*chunk]:
+                    column = chunk.pop(column_name)
+                    if length == len(column):
+                        column.flush()
+                        continue
+
+                    # Cut a partial chunk down to its rows, closing the memory map first
+                    rows, path = np.array(column[:length]), column.filename
+                    del column
+                    np.save(path, rows)
+                self.__manifest['chunks'].append({'dir': name, 'length': length})
+                write_json_atomic(self.__directory / MANIFEST_FILE, self.__manifest)
+            # Raised by the next `step`, `flush` or `close`, and later chunks are still written
+            # pylint: disable=W0703
+            except Exception as err:
+                if self.__error is None:
+                    self.__error = err
+            finally:
+                self.__jobs.task_done()
+
+
+class TrajectoryReader(object):
+    """
+    Reads back a recording made by `TrajectoryRecorder`, as read-only memory maps
+    """
+
+    def __init__(self, directory):
+        self.__directory = Path(directory)
+        with open(str(self.__directory / MANIFEST_FILE)) as manifest_file:
+            self.__manifest = json.load(manifest_file)
+
+    @property
+    def reward_types(self):
+        """
+        The reward types of the recorded environment, in the order of its decomposition
+        """
+        return self.__manifest['reward_types']
+
+    @property
+    def columns(self):
+        """
+        The names of the recorded columns
+        """
+        return [*self.__manifest['columns']]
+
+    @property
+    def num_chunks(self):
+        """
+        The number of finished chunks
+        """
+        return len(self.__manifest['chunks'])
+
+    def __len__(self):
+        return sum(chunk['length'] for chunk in self.__manifest['chunks'])
+
+    def chunk(self, idx):
+        """
+        A dict of column name to the memory mapped rows of the `idx`-th chunk
+        """
+        return {name: self.__load(idx, name) for name in self.columns}
+
+    def column(self, name):
+        """
+        The memory mapped rows of one column, as a list with one array per chunk
+        """
+        return [self.__load(idx, name) for idx in range(self.num_chunks)]
+
+    def __load(self, idx, name):
+        info = self.__manifest['chunks'][idx]
+        path = self.__directory / info['dir'] / self.__manifest['columns'][name]['file']
+        return np.load(str(path), mmap_mode='r')[:info['length']]
+
+    def decomposed_rewards(self, idx):
+        """
+        An `(length, len(reward_types))` array of the decomposed rewards of the `idx`-th chunk.
+        Unlike the columns, this is a copy.
+        """
+        chunk = self.chunk(idx)
+        return np.stack([chunk['reward/%s' % r_type] for r_type in self.reward_types], axis=1)
@@ -0,0 +1,219 @@
+"""
+Replay storage for agents learning from decomposed rewards (e.g. HRA or decomposed DQN).
+
+`DecomposedReplayBuffer` keeps a fixed number of transitions in NumPy ring buffers, with one
+reward column per reward type, and samples them uniformly or in proportion to priorities
+kept in a `SumTree`. Adding, sampling and updating priorities all work on whole batches.
+"""
+import numpy as np
+
+
+class SumTree(object):
+    """
+    A binary tree over `capacity` non-negative priorities, where each node holds the sum of its
+    children. Updating priorities and finding the leaf a prefix sum falls in both take
+    O(log capacity), and are vectorized over batches.
+    """
+
+    def __init__(self, capacity):
+        self.__capacity = capacity
+        self.__depth = max(int(np.ceil(np.log2(capacity))), 0)
+        self.__leaves = 2 ** self.__depth
+        # Node 1 is the root and node i has children 2i and 2i + 1, so the leaves are the
+        # second half of the array
+        self.__tree = np.zeros(2 * self.__leaves)
+
+    @property
+    def capacity(self):
+        """
+        The number of priorities in the tree
+        """
+        return self.__capacity
+
+    @property
+    def total(self):
+        """
+        The sum of all of the priorities
+        """
+        return self.__tree[1]
+
+    def __getitem__(self, indices):
+        return self.__tree[self.__leaves + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        """
+        Sets the priorities at the given indices. If an index is repeated, its last
+        priority is kept.
+        """
+        nodes = self.__leaves + np.asarray(indices).reshape(-1)
+        self.__tree[nodes] = np.asarray(priorities, dtype=float).reshape(-1)
+        for _ in range(self.__depth):
+            nodes = np.unique(nodes // 2)
+            self.__tree[nodes] = self.__tree[2 * nodes] + self.__tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        The indices whose priority intervals contain each of the prefix sums `values`,
+        which should be in `[0, total)`
+        """
+        values = np.array(values, dtype=float).reshape(-1)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.__depth):
+            left = self.__tree[2 * nodes]
+            go_right = values >= left
+            values -= np.where(go_right, left, 0.)
+            nodes = 2 * nodes + go_right
+
+        # Rounding can overshoot onto an empty leaf at the end
+        return np.minimum(nodes - self.__leaves, self.__capacity - 1)
+
+
+class DecomposedReplayBuffer(object):
+    """
+    Stores up to `capacity` transitions `(obs, action, decomposed reward, next obs, terminal)`,
+    overwriting the oldest once full. Decomposed rewards are `(len(reward_types),)` arrays
+    ordered like `reward_types`, e.g. the `info['reward_decomposition']` of an environment
+    with `array_decomposition=True`.
+
+    With `prioritized=True`, transitions are sampled with probability proportional to their
+    priority to the power of `alpha` (new transitions get the highest priority seen so far),
+    and `sample` returns the matching importance sampling weights.
+    """
+
+    def __init__(self, capacity, obs_shape, reward_types, obs_dtype=np.float32,
+                 action_dtype=np.int64, prioritized=True, alpha=0.6, eps=1e-6, seed=None):
+        self.__capacity = capacity
+        self.__reward_types = [*reward_types]
+        self.__prioritized = prioritized
+        self.__alpha = alpha
+        self.__eps = eps
+        self.__rng = np.random.RandomState(seed)
+
+        obs_shape = tuple(obs_shape)
+        self.__obs = np.zeros((capacity,) + obs_shape, dtype=obs_dtype)
+        self.__next_obs = np.zeros((capacity,) + obs_shape, dtype=obs_dtype)
+        self.__actions = np.zeros(capacity, dtype=action_dtype)
+        self.__rewards = np.zeros((capacity, len(self.__reward_types)))
+        self.__terminals = np.zeros(capacity, dtype=bool)
+
+        self.__tree = SumTree(capacity) if prioritized else None
+        self.__max_priority = 1.0
+        self.__next = 0
+        self.__size = 0
+
+    @classmethod
+    def from_env(cls, env, capacity, **kwargs):
+        """
+        A buffer for the observations and `reward_types` of `env`, which is reset to find
+        the shape of an observation if it has no observation space
+        """
+        space = getattr(env, 'observation_space', None)
+        if space is not None and space.shape is not None:
+            obs_shape = space.shape
+        else:
+            obs_shape = np.shape(env.reset())
+        return cls(capacity, obs_shape, env.unwrapped.reward_types, **kwargs)
+
+    @property
+    def capacity(self):
+        """
+        The most transitions kept
+        """
+        return self.__capacity
+
+    @property
+    def reward_types(self):
+        """
+        The reward types, in the order of the reward columns
+        """
+        return self.__reward_types
+
+    @property
+    def rewards(self):
+        """
+        The stored `(len(self), len(reward_types))` decomposed rewards, as a read-only view
+        """
+        view = self.__rewards[:self.__size]
+        view.flags.writeable = False
+        return view
+
+    def __len__(self):
+        return self.__size
+
+    def add(self, obs, action, reward, next_obs, terminal):
+        """
+        Stores one transition, returning its index
+        """
+        return self.add_batch([obs], [action], [reward], [next_obs], [terminal])[0]
+
+    def add_batch(self, obs, actions, rewards, next_obs, terminals):
+        """
+        Stores a batch of transitions (e.g. one step of a vector environment), with the
+        decomposed rewards as an `(B, len(reward_types))` array. Returns their indices.
+        """
+        rewards = np.asarray(rewards, dtype=float)
+        if rewards.shape[1:] != (len(self.__reward_types),):
+            raise ValueError("Expected decomposed rewards of shape (B, %d), got %s"
+                             % (len(self.__reward_types), rewards.shape))
+
+        indices = (self.__next + np.arange(len(rewards))) % self.__capacity
+        self.__obs[indices] = obs
+        self.__actions[indices] = actions
+        self.__rewards[indices] = rewards
+        self.__next_obs[indices] = next_obs
+        self.__terminals[indices] = terminals
+
+        if self.__tree is not None:
+            self.__tree.update(indices, np.full(len(indices), self.__max_priority))
+
+        self.__next = (self.__next + len(rewards)) % self.__capacity
+        self.__size = min(self.__size + len(rewards), self.__capacity)
+        return indices
+
+    def sample(self, batch_size, beta=0.4):
+        """
+        Samples a batch of transitions, as a dict of `obs`, `actions`, `rewards` (an
+        `(batch_size, len(reward_types))` array), `next_obs`, `terminals`, the `indices`
+        to update priorities with and the importance sampling `weights` (normalized to a
+        maximum of 1, and all 1 when sampling uniformly).
+        """
+        if not self.__size:
+            raise Exception("Cannot sample from an empty replay buffer")
+
+        if self.__tree is None:
+            indices = self.__rng.randint(self.__size, size=batch_size)
+            weights = np.ones(batch_size)
+        else:
+            # Stratified over the total priority, one sample per equal segment
+            total = self.__tree.total
+            values = (np.arange(batch_size) + self.__rng.rand(batch_size)) * (total / batch_size)
+            indices = np.minimum(self.__tree.find(values), self.__size - 1)
+
+            probs = self.__tree[indices] / total
+            weights = (self.__size * probs) ** -beta
+            weights /= weights.max()
+
+        return {'obs': self.__obs[indices],
+                'actions': self.__actions[indices],
+                'rewards': self.__rewards[indices],
+                'next_obs': self.__next_obs[indices],
+                'terminals': self.__terminals[indices],
+                'weights': weights,
+                'indices': indices}
+
+    def update_priorities(self, indices, td_errors):
+        """
+        Sets the priorities of sampled transitions from their TD errors, either `(B,)` or
+        per reward type `(B, len(reward_types))`, in which case the absolute errors of the
+        components are summed
+        """
+        if self.__tree is None:
+            return
+
+        td_errors = np.abs(np.asarray(td_errors, dtype=float))
+        if td_errors.ndim == 2:
+            td_errors = td_errors.sum(axis=1)
+
+        priorities = (td_errors + self.__eps) ** self.__alpha
+        self.__tree.update(indices, priorities)
+        self.__max_priority = max(self.__max_priority, priorities.max())
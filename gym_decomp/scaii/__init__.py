@@ -1,56 +1,117 @@
 """
 Wrappers for SCAII scenarios, primarily four towers derivatives.
+
+SCAII itself is only checked for (and installed if missing) when the first environment
+is made, so importing this module is free.
 """
-import os
 from pathlib import Path
-import logging
 
 import gym
 from gym import spaces
+import numpy as np
 
+from gym_decomp.profiling import PhaseTimer
 import gym_decomp.scaii.bootstrap as scaii_bootstrap
+from gym_decomp.scaii.pool import ResetPool
+from gym_decomp.scaii.recording import REPLAY_FILE, ReplayArchiver
 
-scaii_bootstrap.check_setup()
-
-from scaii.env.sky_rts.env.scenarios.city_attack import CityAttack
-from scaii.env.explanation import Explanation, BarChart, BarGroup, Bar
+# pylint: disable=C0103,W0603
 
+# The SCAII classes, imported by `load_scaii`
+CityAttack = Explanation = BarChart = BarGroup = Bar = None
 
 REPLAY_PATH = (Path.home() / ".scaii/replays/")
 
+# The 40x40 layers of the state, in order along its last axis
+LAYERS = ['hp', 'friend', 'enemy', 'tank', 'large tower', 'small tower', 'large city',
+          'small city']
+
+
+def load_scaii(archive_path=None):
+    """
+    Checks the SCAII install (installing it from the local `archive_path` if given, see
+    `bootstrap.check_setup`) and imports it. Only the first call in a process does any work.
+    """
+    global CityAttack, Explanation, BarChart, BarGroup, Bar
+    if CityAttack is not None:
+        return
+
+    scaii_bootstrap.check_setup(archive_path)
+
+    from scaii.env.sky_rts.env.scenarios.city_attack import CityAttack as _CityAttack
+    from scaii.env.explanation import Explanation, BarChart, BarGroup, Bar
+    CityAttack = _CityAttack
+
 
 class FourTowersV1(gym.Env):
     """
     The SCAII City Attack scenario (an expanded Four Towers with cities and enemy tanks)
+
+    With `array_decomposition=True`, `info['reward_decomposition']` is an array ordered
+    like `reward_types` instead of a dict.
+
+    With `reset_pool_size > 0`, that many extra backend worlds are kept reset in the
+    background (see `ResetPool`), so `reset` swaps in a ready episode instead of waiting
+    for the backend. Recording episodes are always reset synchronously.
+
+    Observations can be restricted to some of the `LAYERS` with `layers`, and converted to
+    a compact dtype with `layer_dtypes`: either one dtype for all of them, or a dict of
+    layer name to dtype (layers left out keep the backend's dtype), e.g.
+    `{'hp': np.float32, 'friend': np.uint8}`. If the selected layers end up with
+    different dtypes, observations are a dict of layer name to `40x40` map (flattened
+    like the full state) instead of one array. `SubprocVectorEnv` and `TrajectoryRecorder`
+    both handle dict observations.
+
+    The first environment made checks for SCAII, see `load_scaii`. If SCAII is missing,
+    it is installed from the local archive `scaii_archive` when given.
+
+    With `profile=True`, the phases of `step` and `reset` are timed by a `PhaseTimer`
+    available as `profiler`.
     """
 
-    def __init__(self):
-        self.__world = CityAttack()
+    def __init__(self, array_decomposition=False, reset_pool_size=0, layers=None,
+                 layer_dtypes=None, scaii_archive=None, profile=False):
+        load_scaii(scaii_archive)
+        self.__profiler = PhaseTimer() if profile else None
+
+        layers = LAYERS if layers is None else [*layers]
+        unknown = [layer for layer in layers if layer not in LAYERS]
+        if unknown:
+            raise ValueError("Unknown layers %s, expected some of %s" % (unknown, LAYERS))
+        if isinstance(layer_dtypes, dict):
+            unknown = [layer for layer in layer_dtypes if layer not in layers]
+            if unknown:
+                raise ValueError("Dtypes given for unselected layers %s" % unknown)
+
+        if not isinstance(layer_dtypes, dict):
+            layer_dtypes = {layer: layer_dtypes for layer in layers}
+
+        self.__layers = layers
+        # The configured dtype of each layer, None to keep the backend's
+        self.__layer_dtypes = {layer: None if layer_dtypes.get(layer) is None
+                               else np.dtype(layer_dtypes[layer]) for layer in layers}
+        # The dtype of each layer once the backend's dtype is known
+        self.__resolved_dtypes = None
+        self.__backend_dtype = None
+        self.__layer_indices = [LAYERS.index(layer) for layer in layers]
+
+        self.__map_name = None
+        self.__world = self.__new_world()
+        self.__reset_pool_size = reset_pool_size
+        self.__pool = self.__new_pool()
+        self.__array_decomposition = array_decomposition
         self.__record = False
+        self.__archiver = None
+        self.__default_explanations = {}
         self.recording_ep = 0
         self.__flatten_state = True
 
         self.__curr_state = None
+        self.__obs = None
+        self.__flat_obs = None
 
         self.action_space = spaces.Discrete(4)
 
-        if REPLAY_PATH.exists() and os.listdir(REPLAY_PATH):
-            logging.warning(
-                "Warning, replays in .scaii/replays may get clobbered,\
-                appending .bak and making a fresh directory")
-
-            num_baks = 1
-            basepath = REPLAY_PATH
-            suffix = '.bak'*num_baks
-            target = basepath.with_suffix(suffix)
-
-            while target.exists():
-                num_baks += 1
-                suffix = '.bak'*num_baks
-                target = basepath.with_suffix(suffix)
-
-            basepath.rename(target)
-
     def change_map(self, map_name):
         """
         Change the map to another one in the Sky-RTS backend maps directory.
@@ -61,11 +122,25 @@ class FourTowersV1(gym.Env):
         This is primarily useful for loading hand-coded or
         "static" versions for testing hand-tailored states.
         """
-        self.__curr_state = None
-        self.__world = CityAttack(map_name=map_name)
+        self.__set_state(None)
+        self.__map_name = map_name
+        self.__world = self.__new_world()
+        if self.__pool is not None:
+            self.__pool.close()
+        self.__pool = self.__new_pool()
 
         return self.reset()
 
+    def __new_world(self):
+        if self.__map_name is None:
+            return CityAttack()
+        return CityAttack(map_name=self.__map_name)
+
+    def __new_pool(self):
+        if not self.__reset_pool_size:
+            return None
+        return ResetPool(self.__new_world() for _ in range(self.__reset_pool_size))
+
     @property
     def flatten_state(self):
         """
@@ -79,10 +154,48 @@ class FourTowersV1(gym.Env):
     def flatten_state(self, val):
         self.__flatten_state = val
 
+    @property
+    def layers(self):
+        """
+        The names of the layers in an observation, in order
+        """
+        return self.__layers
+
+    @property
+    def layer_dtypes(self):
+        """
+        The dtype of each layer in an observation, as a dict of layer name to dtype.
+        Layers without a dtype in `layer_dtypes` keep the backend's, so if there are any
+        this is only known after the first reset.
+        """
+        if self.__resolved_dtypes is not None:
+            return dict(self.__resolved_dtypes)
+
+        unknown = [layer for layer, dtype in self.__layer_dtypes.items() if dtype is None]
+        if unknown:
+            raise Exception("The dtypes of layers %s are the backend's, which is only known "
+                            "after the first reset" % unknown)
+        return dict(self.__layer_dtypes)
+
+    @property
+    def array_decomposition(self):
+        """
+        Whether the reward decomposition is given as an array in the order of `reward_types`
+        (as opposed to a dict). Reward types missing from a step are 0.
+        """
+        return self.__array_decomposition
+
+    @array_decomposition.setter
+    def array_decomposition(self, val):
+        self.__array_decomposition = val
+
     @property
     def record(self):
         """
-        Whether to dump this to a SCAII replay file
+        Whether to dump this to a SCAII replay file.
+
+        Finished replays are compressed into `.scaii/replays/archive` and listed in
+        `.scaii/replays/index.json` by a background thread (see `gym_decomp.scaii.recording`).
         """
         return self.__record
 
@@ -90,6 +203,15 @@ class FourTowersV1(gym.Env):
     def record(self, val):
         self.__record = val
 
+    @property
+    def profiler(self):
+        """
+        The `PhaseTimer` timing `step` (phases `explanation` when recording, `act` for the
+        backend, `observe` and `decomposition`) and `reset` (phases `archive` when recording,
+        `reset` and `observe`), or None if profiling is off
+        """
+        return self.__profiler
+
     @property
     def action_meanings(self):
         """
@@ -112,42 +234,102 @@ class FourTowersV1(gym.Env):
         you can get a peek at the current state unflattened if you need it.
 
         However, if you want this info just once, it's recommended to just use `unflattened_state`
+
+        This is a read-only view of the state that is never copied (the flattened one is a
+        view as well), so copy it if you need to modify it. It only holds the selected
+        `layers`, or is a dict of them if they have different dtypes.
         """
         if self.__flatten_state:
-            return self.__curr_state.flatten()
+            return self.__flat_obs
         else:
-            return self.__curr_state
+            return self.__obs
 
     @property
     def unflattened_state(self):
         """
-        The raw, unflattened state, if you need it
+        The raw, unflattened state, if you need it, as a read-only view.
+        This always has every layer in the backend's dtype.
         """
         return self.__curr_state
 
+    def __set_state(self, state):
+        if state is None:
+            self.__curr_state, self.__obs, self.__flat_obs = None, None, None
+            return
+
+        self.__curr_state = self.__read_only(np.ascontiguousarray(state))
+        self.__obs = self.__select_layers(self.__curr_state)
+        if isinstance(self.__obs, dict):
+            self.__flat_obs = {layer: obs.reshape(-1) for layer, obs in self.__obs.items()}
+        else:
+            self.__flat_obs = self.__obs.reshape(-1)
+
+    def __select_layers(self, state):
+        dtypes = self.__resolved_dtypes
+        if dtypes is None or self.__backend_dtype != state.dtype:
+            self.__backend_dtype = state.dtype
+            dtypes = self.__resolved_dtypes = {
+                layer: state.dtype if dtype is None else dtype
+                for layer, dtype in self.__layer_dtypes.items()}
+
+        if len(set(dtypes.values())) > 1:
+            return {layer: self.__read_only(np.ascontiguousarray(state[..., idx],
+                                                                 dtype=dtypes[layer]))
+                    for layer, idx in zip(self.__layers, self.__layer_indices)}
+
+        dtype = dtypes[self.__layers[0]]
+        if self.__layers == LAYERS and dtype == state.dtype:
+            return state
+        return self.__read_only(np.ascontiguousarray(state[..., self.__layer_indices], dtype=dtype))
+
+    @staticmethod
+    def __read_only(arr):
+        arr = arr.view()
+        arr.flags.writeable = False
+        return arr
+
     def render(self, mode='print'):
         return self.unflattened_state
 
     def reset(self):
-        if self.record and not REPLAY_PATH.exists():
-            REPLAY_PATH.mkdir()
+        profiler = self.__profiler
+        if profiler:
+            profiler.start()
 
         if self.record:
-            replay_file = REPLAY_PATH / "replay.scr"
-            if replay_file.exists():
-                target = REPLAY_PATH / ("replay%d.scr" % self.recording_ep)
-                (REPLAY_PATH / "replay.scr").replace(target)
-
-            self.__curr_state = self.__world.reset(
-                record=self.record).state
+            if self.__archiver is None:
+                self.__archiver = ReplayArchiver(REPLAY_PATH)
+            self.__archiver.archive(REPLAY_PATH / REPLAY_FILE, self.recording_ep)
+            if profiler:
+                profiler.lap('archive')
+
+            obs = self.__world.reset(record=self.record)
+        elif self.__pool is not None:
+            self.__world, obs = self.__pool.take(self.__world)
         else:
-            self.__curr_state = self.__world.reset().state
+            obs = self.__world.reset()
+        if profiler:
+            profiler.lap('reset')
+
+        self.__set_state(obs.state)
+        if profiler:
+            profiler.lap('observe')
 
         if self.record:
             self.recording_ep += 1
 
         return self.curr_state
 
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool = None
+
+        if self.__archiver is not None:
+            self.__archiver.archive(REPLAY_PATH / REPLAY_FILE, self.recording_ep)
+            self.__archiver.close()
+            self.__archiver = None
+
     # pylint: disable=W0221
     def step(self, action, q_vals=None):
         """
@@ -158,6 +340,10 @@ class FourTowersV1(gym.Env):
         Each of these entries should contain a list, in order, for each of the four actions.
         """
         assert action in range(0, 4)
+        profiler = self.__profiler
+        if profiler:
+            profiler.start()
+
         a = self.__world.new_action()
         # pylint: disable=E1101
         a.attack_quadrant(action+1)
@@ -166,29 +352,49 @@ class FourTowersV1(gym.Env):
         if self.record:
             if q_vals is not None:
                 explanation = self.__build_explanation(q_vals)
-                obs = self.__world.act(a, explanation=explanation)
             else:
-                explanation = Explanation(
-                    "Attack %s" % self.action_meanings[action])
-                obs = self.__world.act(a, explanation=explanation)
+                explanation = self.__default_explanation(action)
+            if profiler:
+                profiler.lap('explanation')
+            obs = self.__world.act(a, explanation=explanation)
         else:
             obs = self.__world.act(a)
+        if profiler:
+            profiler.lap('act')
 
-        self.__curr_state = obs.state
+        self.__set_state(obs.state)
         terminal = obs.is_terminal()
+        if profiler:
+            profiler.lap('observe')
 
         reward = 0.0
         for val in obs.typed_reward.values():
             reward += float(val)
 
+        if self.__array_decomposition:
+            typed_reward = obs.typed_reward
+            decomp = np.array([float(typed_reward.get(r_type, 0.0))
+                               for r_type in self.reward_types])
+            if profiler:
+                profiler.lap('decomposition')
+            return self.curr_state, reward, terminal, {"reward_decomposition": decomp}
+
         for r_type in self.reward_types:
             if r_type not in obs.typed_reward:
                 obs.typed_reward[r_type] = 0.0
 
         info = {"reward_decomposition": dict(obs.typed_reward)}
+        if profiler:
+            profiler.lap('decomposition')
 
         return self.curr_state, reward, terminal, info
 
+    def __default_explanation(self, action):
+        if action not in self.__default_explanations:
+            self.__default_explanations[action] = Explanation(
+                "Attack %s" % self.action_meanings[action])
+        return self.__default_explanations[action]
+
     def __build_explanation(self, q_vals):
         explanation = Explanation("Predicted Reward Per Quadrant")
         chart = BarChart("Move Explanation", "Actions", "QVal By Reward Type")
@@ -7,7 +7,20 @@ import urllib.request
 import tarfile
 from zipfile import ZipFile
 
-__all__ = ["check_setup"]
+__all__ = ["check_setup", "is_installed"]
+
+# Bump this when the checks below change, so existing installs get verified again
+BOOTSTRAP_VERSION = "1"
+
+# A file in <home>/.scaii recording that the install passed `check_setup`
+VERIFIED_MARKER = ".gym_decomp_verified"
+
+# Installs from this local archive (e.g. a downloaded Linux-x86_64.scaii.tar.gz) instead of
+# downloading the latest release, for machines without network access
+ARCHIVE_ENV_VAR = "GYM_DECOMP_SCAII_ARCHIVE"
+
+# Whether this process already passed `check_setup`
+_verified = False
 
 
 class ArchiveType(IntEnum):
@@ -26,33 +39,77 @@ REMOVE_STRING = "SCAII appears to be present but corrupted, may we delete <home>
 INPUT_ERROR = "Enter 'y' or 'n': "
 
 
-def check_setup():
+def check_setup(archive_path: str=None) -> None:
+    """
+    Makes sure SCAII is installed and importable, installing it if needed.
+
+    This only does the work once per process, and once per install: afterwards a marker
+    in <home>/.scaii (keyed by `install_key`) skips straight to adding the python glue
+    to `sys.path`. SCAII is installed from the local `archive_path` (or the archive
+    named by the `GYM_DECOMP_SCAII_ARCHIVE` environment variable) if given, and otherwise
+    downloaded.
+    """
+    global _verified  # pylint: disable=W0603
+    if _verified:
+        return
+
+    archive_path = archive_path or os.environ.get(ARCHIVE_ENV_VAR)
     scaii_root = Path.home() / ".scaii"
-    if not scaii_root.exists():
-        install_scaii()
+    if is_verified():
+        amend_path()
     else:
-        bin_dir = scaii_root / "bin"
-        if not bin_dir.exists():
-            reinstall_fallback()
+        if not scaii_root.exists():
+            install_scaii(archive_path=archive_path)
+        elif not is_installed():
+            reinstall_fallback(archive_path)
+
+        check_amend_path()
+        try:
+            (scaii_root / VERIFIED_MARKER).write_text(install_key())
+        # A read-only install just gets checked every time
+        except OSError:
+            pass
+
+    _verified = True
+
 
-        backends_dir = scaii_root / "backends"
-        if not backends_dir.exists():
-            reinstall_fallback()
+def is_installed() -> bool:
+    """
+    Whether all of the SCAII directories are in <home>/.scaii, without prompting or
+    installing anything
+    """
+    scaii_root = Path.home() / ".scaii"
+    return all((scaii_root / sub_dir).exists() for sub_dir in ["bin", "backends", "glue/python"])
+
+
+def install_key() -> str:
+    """
+    Identifies the current install: the `BOOTSTRAP_VERSION` and when the python glue was
+    installed, so reinstalling SCAII invalidates the verified marker
+    """
+    glue_dir = Path.home() / ".scaii" / "glue" / "python"
+    return "%s:%d" % (BOOTSTRAP_VERSION, glue_dir.stat().st_mtime_ns)
 
-        glue_dir = scaii_root / "glue/python"
-        if not glue_dir.exists():
-            reinstall_fallback()
 
-    check_amend_path()
+def is_verified() -> bool:
+    """
+    Whether the current install already passed `check_setup`
+    """
+    marker = Path.home() / ".scaii" / VERIFIED_MARKER
+    try:
+        return marker.read_text().strip() == install_key()
+    except OSError:
+        return False
 
 
-def reinstall_fallback() -> None:
+def reinstall_fallback(archive_path: str=None) -> None:
     print("The .scaii directory appears to be present but corrupted, "
           "proceeding to reinstallation fallback")
 
-    reinstall_permission = get_permission(REMOVE_STRING)
+    # Passing a local archive is already permission to install it
+    reinstall_permission = archive_path is not None or get_permission(REMOVE_STRING)
 
-    install_scaii(reinstall_permission)
+    install_scaii(reinstall_permission, archive_path)
 
 
 def get_permission(msg: str) -> bool:
@@ -73,7 +130,14 @@ def get_permission(msg: str) -> bool:
             return True
 
 
-def install_scaii(pre_permission: bool=False) -> None:
+def install_scaii(pre_permission: bool=False, archive_path: str=None) -> None:
+    # A local archive was asked for explicitly, so install it without prompting (workers
+    # may have no stdin), whatever the platform, and tell zip from tar.gz by its name
+    if archive_path is not None:
+        archive = Path(archive_path)
+        extract(archive, ArchiveType.ZIP if archive.suffix == '.zip' else ArchiveType.GZ)
+        return
+
     if platform.system() == 'Windows':
         archive_name = "Windows10_x86_64.scaii.zip"
         archive_type = ArchiveType.ZIP
@@ -103,30 +167,39 @@ def download_extract(archive_name: str, archive_type: ArchiveType) -> None:
                        Path.home() / archive_name)
 
     print()
-    print("Extracting...")
     try:
-        if archive_type.value == ArchiveType.ZIP.value:
-            file = ZipFile(Path.home() / archive_name)
-            file.extractall(path=Path.home())
-            file.close()
-        elif archive_type.value == ArchiveType.GZ.value:
-            file = tarfile.open(Path.home() / archive_name, mode='r:gz')
-            file.extractall(Path.home())
-            file.close()
+        extract(Path.home() / archive_name, archive_type)
     finally:
         os.remove(str(Path.home() / archive_name))
 
+
+def extract(archive: Path, archive_type: ArchiveType) -> None:
+    print("Extracting...")
+    if archive_type.value == ArchiveType.ZIP.value:
+        file = ZipFile(str(archive))
+        file.extractall(path=Path.home())
+        file.close()
+    elif archive_type.value == ArchiveType.GZ.value:
+        file = tarfile.open(str(archive), mode='r:gz')
+        file.extractall(Path.home())
+        file.close()
+
     print("Done")
 
 
+def amend_path() -> None:
+    glue_path = str(Path.home() / ".scaii" / "glue" / "python")
+    if glue_path not in sys.path:
+        sys.path.append(glue_path)
+
+
 def check_amend_path() -> None:
     # ignore the errors while editing, they're intended
     try:
         from scaii.env.sky_rts.env.scenarios.city_attack import CityAttack
         from scaii.env.explanation import Explanation, BarChart, BarGroup, Bar
     except ImportError:
-        glue_path = Path.home() / ".scaii" / "glue" / "python"
-        sys.path.append(str(glue_path))
+        amend_path()
 
     try:
         from scaii.env.sky_rts.env.scenarios.city_attack import CityAttack
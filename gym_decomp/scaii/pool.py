@@ -0,0 +1,50 @@
+"""
+A pool of SCAII backend worlds reset ahead of time, so episode boundaries don't stall the learner.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _reset(world):
+    return world, world.reset()
+
+
+class ResetPool(object):
+    """
+    Keeps the given backend worlds (e.g. `CityAttack` instances) resetting in background
+    threads. `take` hands out a world whose reset has finished along with its first
+    observation, and starts resetting the world it replaces.
+
+    The backend does the work in its own process, so the threads only wait on it.
+    """
+
+    def __init__(self, worlds):
+        worlds = [*worlds]
+        if not worlds:
+            raise ValueError("A reset pool needs at least one world")
+
+        self.__executor = ThreadPoolExecutor(max_workers=len(worlds))
+        self.__ready = deque(self.__executor.submit(_reset, world) for world in worlds)
+
+    @property
+    def size(self):
+        """
+        The number of worlds kept in the pool
+        """
+        return len(self.__ready)
+
+    def take(self, finished):
+        """
+        Swaps the `finished` world for one that is already reset, returning it and its first
+        observation. Waits only if the oldest reset in the pool is still running.
+        """
+        world, obs = self.__ready.popleft().result()
+        self.__ready.append(self.__executor.submit(_reset, finished))
+        return world, obs
+
+    def close(self):
+        """
+        Waits for the pending resets and stops the background threads
+        """
+        self.__executor.shutdown(wait=True)
+        self.__ready.clear()
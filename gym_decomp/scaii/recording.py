@@ -0,0 +1,147 @@
+"""
+Background archival of SCAII replays.
+
+The backend writes each recorded episode to `replay.scr` in the replay directory. Instead of
+renaming replays (and whole replay directories) to keep them apart, finished replays are
+moved aside, compressed with LZMA and indexed by a background thread, so recording
+doesn't slow down the episodes being recorded.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pylzma
+
+from gym_decomp.util import write_json_atomic
+
+ARCHIVE_DIR = "archive"
+INDEX_FILE = "index.json"
+
+# Where the backend writes the replay of the episode being recorded
+REPLAY_FILE = "replay.scr"
+
+# Guards the read-modify-write of the index between archivers of the same process
+_INDEX_LOCK = threading.Lock()
+
+
+def read_index(replay_path):
+    """
+    The list of archived replays in `replay_path`, oldest first. Each entry is a dict with the
+    `session`, `episode`, archive `file` (relative to `replay_path`), `raw_bytes`,
+    `compressed_bytes` and `recorded_at` (a UNIX time).
+    """
+    index_path = Path(replay_path) / INDEX_FILE
+    if not index_path.exists():
+        return []
+    with open(str(index_path)) as index_file:
+        return json.load(index_file)
+
+
+def load_replay(replay_path, entry):
+    """
+    The decompressed contents of the archived replay described by an index entry,
+    ready to be written to a `.scr` file for the SCAII viewer
+    """
+    with open(str(Path(replay_path) / entry['file']), 'rb') as archive:
+        return pylzma.decompress(archive.read())
+
+
+class ReplayArchiver(object):
+    """
+    Archives finished replays from `replay_path` on a background thread.
+
+    Each archiver is its own recording session, so replays from different runs (or from
+    several environments sharing the directory) never clobber each other. A `REPLAY_FILE`
+    left over from an earlier run is moved aside (to `archive/<session>_stale.scr`) when
+    the archiver is made, rather than archived as this session's first episode.
+    """
+
+    def __init__(self, replay_path):
+        self.__replay_path = Path(replay_path)
+        self.__archive_path = self.__replay_path / ARCHIVE_DIR
+        self.__archive_path.mkdir(parents=True, exist_ok=True)
+        self.__session = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+
+        stale = self.__replay_path / REPLAY_FILE
+        if stale.exists():
+            moved = self.__archive_path / ("%s_stale.scr" % self.__session)
+            logging.warning("Moving the replay left over from an earlier run to %s", moved)
+            os.replace(str(stale), str(moved))
+
+        self.__jobs = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    @property
+    def session(self):
+        """
+        The name of this recording session, used in the archive names
+        """
+        return self.__session
+
+    def archive(self, replay_file, episode):
+        """
+        Queues a finished replay for compression. The file is moved aside right away (a
+        rename), so the backend is free to start writing the next replay to the same path.
+        """
+        replay_file = Path(replay_file)
+        if not replay_file.exists():
+            return
+
+        pending = self.__archive_path / ("%s_%d.scr.pending" % (self.__session, episode))
+        os.replace(str(replay_file), str(pending))
+        self.__jobs.put((pending, episode, time.time()))
+
+    def flush(self):
+        """
+        Waits until every queued replay is archived
+        """
+        self.__jobs.join()
+
+    def close(self):
+        """
+        Archives the queued replays and stops the background thread
+        """
+        self.__jobs.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            job = self.__jobs.get()
+            try:
+                if job is None:
+                    return
+                self.__compress(*job)
+            # A bad replay shouldn't stop the ones after it from being archived
+            # pylint: disable=W0703
+            except Exception:
+                logging.exception("Failed to archive replay %s", job[0])
+            finally:
+                self.__jobs.task_done()
+
+    def __compress(self, pending, episode, recorded_at):
+        with open(str(pending), 'rb') as replay:
+            raw = replay.read()
+        compressed = pylzma.compress(raw)
+
+        name = "%s_%d.scr.lzma" % (self.__session, episode)
+        with open(str(self.__archive_path / name), 'wb') as archive:
+            archive.write(compressed)
+        os.remove(str(pending))
+
+        entry = {'session': self.__session,
+                 'episode': episode,
+                 'file': str(Path(ARCHIVE_DIR) / name),
+                 'raw_bytes': len(raw),
+                 'compressed_bytes': len(compressed),
+                 'recorded_at': recorded_at}
+
+        with _INDEX_LOCK:
+            index = read_index(self.__replay_path)
+            index.append(entry)
+            write_json_atomic(self.__replay_path / INDEX_FILE, index)
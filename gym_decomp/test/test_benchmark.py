@@ -0,0 +1,44 @@
+"""
+Tests for the environment benchmarks
+"""
+import json
+import sys
+
+from gym_decomp import benchmark
+from gym_decomp.scaii import bootstrap
+
+# pylint: disable=C0111
+
+
+def test_benchmark_env():
+    result = benchmark.benchmark_env('Cliffworld-v0', steps=50, resets=5, alloc_steps=10,
+                                     model_calls=20)
+
+    assert result['steps_per_sec'] > 0
+    for timing in [result['reset_sec'], result['step_sec']]:
+        assert 0 < timing['p50'] <= timing['p99']
+    assert result['alloc_bytes_per_step'] >= 0 and result['peak_rss_kb'] > 0
+    assert set(result['model']) == set(benchmark.MODEL_CALLS)
+
+
+def test_benchmark_without_resource(monkeypatch):
+    # As on Windows, where there's no `resource` module
+    monkeypatch.setitem(sys.modules, 'resource', None)
+    result = benchmark.benchmark_env('MiniGridworld-v0', steps=10, resets=1, alloc_steps=5,
+                                     model_calls=0)
+
+    assert result['peak_rss_kb'] is None and result['steps_per_sec'] > 0
+
+
+def test_benchmark_json(tmp_path):
+    output = tmp_path / "results.json"
+    benchmark.main(['--env', 'MiniGridworld-v0', '--env', 'ScaiiFourTowers-v1',
+                    '--steps', '20', '--resets', '2', '--alloc-steps', '5',
+                    '--model-calls', '5', '--no-isolate', '--output', str(output)])
+
+    report = json.loads(output.read_text())
+    assert [*tmp_path.iterdir()] == [output]
+    assert report['settings']['steps'] == 20
+    assert 'steps_per_sec' in report['results']['MiniGridworld-v0']
+    if not bootstrap.is_installed():
+        assert 'skipped' in report['results']['ScaiiFourTowers-v1']
@@ -1,4 +1,5 @@
 import gym
+import numpy as np
 import gym_decomp as _
 
 
@@ -24,3 +25,228 @@ def test_state_rep():
     assert total - reward < 1e-4
 
     _ = gym.make('Cliffworld-v0')
+
+
+def test_vector_gridworld():
+    from gym_decomp.gridworld import VectorGridworld
+    from gym_decomp.gridworld.raw.worlds import Cliffworld
+
+    world = Cliffworld()
+    env = VectorGridworld(world, 64)
+    env.seed(0)
+
+    obs = env.reset()
+    assert obs.shape == (64, 20)
+    assert (obs.sum(axis=1) == 1.0).all()
+    assert not world.state_terminals[env.curr_states].any()
+
+    for _ in range(50):
+        obs, reward, terminal, info = env.step(env.np_random.randint(4, size=64))
+        assert obs.shape == (64, 20)
+        assert reward.shape == (64,) and terminal.shape == (64,)
+
+        decomp = info['reward_decomposition']
+        assert decomp.shape == (64, len(env.reward_types))
+        assert np.allclose(decomp.sum(axis=1), reward)
+
+        # Finished episodes are already reset
+        assert not world.state_terminals[env.curr_states].any()
+
+
+def test_vector_gridworld_transitions():
+    from gym_decomp.gridworld import VectorGridworld
+    from gym_decomp.gridworld.raw.worlds import Cliffworld
+
+    world = Cliffworld()
+    env = VectorGridworld(world, 10000)
+    env.seed(0)
+    env.reset()
+
+    # Moving down from the bottom row by the cliff misfires up 10% of the time
+    source = world.index_of((3, 1))
+    env.curr_states[:] = source
+    _, reward, terminal, info = env.step(np.full(10000, 1))
+
+    cliff = info['reward_decomposition'][:, env.reward_types.index('cliff')]
+    assert abs(terminal.mean() - 0.1) < 0.02
+    assert (cliff[terminal] == -10).all() and (reward[~terminal] == 0).all()
+
+
+def test_index_observations():
+    env = gym.make('Cliffworld-v0', obs_mode='index')
+    onehot_env = gym.make('Cliffworld-v0')
+
+    state = env.reset()
+    assert env.observation_space.contains(state)
+
+    for _ in range(20):
+        nxt, reward, terminal, _ = env.step(env.action_space.sample())
+        assert env.observation_space.contains(nxt)
+        assert env.is_terminal(nxt) == terminal
+        assert env.reward(nxt)[0] == reward
+        if terminal:
+            break
+
+    # Every Cliffworld tile is passable, so indices line up with the one-hot positions
+    for state in onehot_env.states:
+        idx = int(state.argmax())
+        assert env.is_terminal(idx) == onehot_env.is_terminal(state)
+        assert env.reward(idx) == onehot_env.reward(state)
+
+
+def test_generated_gridworld():
+    env = gym.make('GeneratedGridworld-v0')
+
+    state = env.reset()
+    assert state.shape == (32 * 32,)
+
+    for _ in range(20):
+        state, reward, terminal, info = env.step(env.action_space.sample())
+        assert env.observation_space.contains(state)
+        assert abs(sum(info['reward_decomposition'].values()) - reward) < 1e-8
+        if terminal:
+            state = env.reset()
+
+    env = gym.make('GeneratedGridworld-v0', shape=(200, 150), obs_mode='index', seed=3)
+    assert env.observation_space.n == env.unwrapped.states[-1] + 1
+    assert env.observation_space.contains(env.reset())
+
+
+def test_vector_gridworld_index_observations():
+    from gym_decomp.gridworld import VectorGridworld
+    from gym_decomp.gridworld.raw.worlds import generate
+
+    world = generate((300, 300), 2, 0.01, seed=0)
+    env = VectorGridworld(world, 256, obs_mode='index')
+    env.seed(0)
+
+    obs = env.reset()
+    assert obs.shape == (256,) and (obs == env.curr_states).all()
+
+    obs, _, terminal, _ = env.step(np.zeros(256, dtype=int))
+    assert obs.shape == (256,) and terminal.shape == (256,)
+
+
+def test_observation_buffer():
+    env = gym.make('Cliffworld-v0', obs_buffer=True, obs_dtype=np.uint8)
+    env.seed(0)
+
+    state = env.reset()
+    assert state.dtype == np.uint8 and state.sum() == 1
+    assert env.observation_space.contains(state)
+
+    for _ in range(50):
+        nxt, _, terminal, _ = env.step(env.action_space.sample())
+        # The same buffer, updated in place, with exactly one hot cell
+        assert nxt is state
+        assert nxt.sum() == 1
+        assert env.is_terminal(nxt) == terminal
+        if terminal:
+            assert env.reset() is state
+
+
+def test_states_dtype():
+    env = gym.make('Cliffworld-v0', obs_dtype=np.uint8).unwrapped
+    env.seed(0)
+
+    states = env.states
+    assert states.dtype == np.uint8 and states is env.states
+    assert any((row == env.reset()).all() for row in states)
+    assert gym.make('Cliffworld-v0').unwrapped.states.dtype == np.float64
+
+
+def test_observation_buffer_allocations():
+    import tracemalloc
+
+    def peak_step_allocation(env):
+        env.seed(0)
+        env.reset()
+        tracemalloc.start()
+        for _ in range(100):
+            if env.step(env.action_space.sample())[2]:
+                env.reset()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak
+
+    kwargs = {'shape': (200, 150), 'density': 0.0, 'terminal_density': 0.0}
+    obs_bytes = 200 * 150 * 4
+    allocating = gym.make('GeneratedGridworld-v0', obs_dtype=np.float32, **kwargs)
+    buffered = gym.make('GeneratedGridworld-v0', obs_dtype=np.float32, obs_buffer=True, **kwargs)
+
+    assert peak_step_allocation(allocating) >= obs_bytes
+    assert peak_step_allocation(buffered) < obs_bytes / 10
+
+
+def test_vector_observation_buffer():
+    from gym_decomp.gridworld import VectorGridworld
+    from gym_decomp.gridworld.raw.worlds import Cliffworld
+
+    env = VectorGridworld(Cliffworld(), 32, obs_dtype=np.float32, obs_buffer=True)
+    env.seed(0)
+
+    obs = env.reset()
+    assert obs.dtype == np.float32
+    for _ in range(20):
+        assert env.step(np.full(32, 3))[0] is obs
+        assert (obs.sum(axis=1) == 1).all()
+        assert (obs.argmax(axis=1) == env.curr_states).all()
+
+
+def test_array_decomposition():
+    env = gym.make('Cliffworld-v0', array_decomposition=True)
+    dict_env = gym.make('Cliffworld-v0')
+    env.seed(0)
+    dict_env.seed(0)
+
+    assert env.reset().argmax() == dict_env.reset().argmax()
+    for _ in range(50):
+        action = env.action_space.sample()
+        state, reward, terminal, info = env.step(action)
+        _, _, _, dict_info = dict_env.step(action)
+
+        decomp = info['reward_decomposition']
+        assert decomp.shape == (len(env.reward_types),)
+        assert decomp.sum() == reward
+        assert [*decomp] == [dict_info['reward_decomposition'][typ] for typ in env.reward_types]
+
+        if terminal:
+            assert env.reset().argmax() == dict_env.reset().argmax()
+
+
+def test_snapshot():
+    env = gym.make('Cliffworld-v0', obs_mode='index').unwrapped
+    env.seed(0)
+    env.reset()
+    for _ in range(3):
+        env.step(3)
+
+    snapshot = env.get_state()
+    branches = []
+    for _ in range(2):
+        assert env.set_state(snapshot) == snapshot[0]
+        branches.append([env.step(action)[:3] for action in [0, 1, 3, 3, 2, 3, 1, 1]])
+
+    assert branches[0] == branches[1]
+
+
+def test_snapshot_buffer():
+    env = gym.make('MiniGridworld-v0', obs_buffer=True).unwrapped
+    env.seed(0)
+    start = env.reset().copy()
+    snapshot = env.get_state()
+
+    env.step(3)
+    obs = env.set_state(snapshot)
+    assert (obs == start).all() and obs.sum() == 1
+
+
+def test_step_before_reset():
+    import pytest
+    from gym_decomp.gridworld import VectorGridworld
+    from gym_decomp.gridworld.raw.worlds import Cliffworld
+
+    for env in [gym.make('Cliffworld-v0'), gym.make('CliffworldDeterministic-v0'),
+                VectorGridworld(Cliffworld(), 2)]:
+        with pytest.raises(Exception, match="before the environment is reset"):
+            env.step(np.zeros(2, dtype=int) if isinstance(env, VectorGridworld) else 0)
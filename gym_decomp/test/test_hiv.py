@@ -2,6 +2,8 @@
 Tests for the HIV Environment
 """
 import gym
+import numpy as np
+import pytest
 
 import gym_decomp as _
 
@@ -40,3 +42,293 @@ def test_act_hiv():
         total += val
 
     assert total - reward < 1e-8
+
+
+def test_array_decomposition_hiv():
+    hiv = gym.make('HivSimulator-v0', array_decomposition=True)
+    hiv.reset()
+
+    for action in range(4):
+        _, reward, _, info = hiv.step(action)
+
+        typed_rewards = info['reward_decomposition']
+        assert typed_rewards.shape == (len(hiv.reward_types),)
+        assert abs(typed_rewards.sum() - reward) < 1e-6 * abs(reward)
+        assert 'warning_decomposition_mismatch' not in info
+
+
+def test_batch_hiv():
+    from gym_decomp.hiv import HivBatchSimV0
+
+    patients = 16
+    batch = HivBatchSimV0(patients)
+    single = gym.make('HivSimulator-v0', array_decomposition=True)
+
+    obs = batch.reset()
+    assert obs.shape == (patients, 6)
+    assert np.allclose(obs, single.reset())
+
+    rng = np.random.RandomState(0)
+    for step in range(200):
+        actions = rng.randint(4, size=patients)
+        actions[0] = step % 4
+        obs, reward, terminal, info = batch.step(actions)
+        nxt, single_reward, single_terminal, single_info = single.step(actions[0])
+
+        assert obs.shape == (patients, 6) and reward.shape == (patients,)
+        assert info['reward_decomposition'].shape == (patients, 4)
+        assert np.allclose(info['reward_decomposition'].sum(axis=1), reward)
+        assert (terminal == single_terminal).all()
+
+        # Same dynamics as the reference integrator, to within the solver's accuracy
+        assert np.abs(obs[0] - nxt).max() < 1e-3
+        assert np.allclose(info['reward_decomposition'][0], single_info['reward_decomposition'],
+                           rtol=1e-2)
+
+    assert terminal.all()
+
+
+def test_decomposed_reward_matches_simulator_hiv():
+    from hiv_simulator.hiv import HIVTreatment
+    from gym_decomp.hiv import dynamics
+    from gym_decomp.hiv.jit import JitHIVTreatment
+
+    world, compiled = HIVTreatment(), JitHIVTreatment()
+    rng = np.random.RandomState(0)
+    for _ in range(50):
+        action = rng.randint(4)
+        world.state = compiled.state = 10 ** rng.uniform(0, 6, size=6)
+
+        typed_reward = world.typed_reward(action)
+        expected = [typed_reward[key] for key in ["V: Free HI viruses", "Episode value 1",
+                                                  "Episode value 2",
+                                                  "E: Cytotoxic T-lymphocytes (Immune Response)"]]
+        assert np.allclose(dynamics.decomposed_reward(world.observe(), action), expected,
+                           rtol=1e-12)
+        assert compiled.typed_reward(action) == pytest.approx(typed_reward, rel=1e-12)
+
+
+def test_dict_decomposition_hiv(monkeypatch):
+    from gym_decomp import hiv as hiv_module
+    from gym_decomp.hiv import DECOMPOSITION_KEYS
+
+    calls = []
+    decompose = hiv_module.decomposed_reward
+    monkeypatch.setattr(hiv_module, 'decomposed_reward',
+                        lambda obs, action: calls.append(action) or decompose(obs, action))
+
+    hiv = gym.make('HivSimulator-v0', integrator='numba_rk4')
+    arrays = gym.make('HivSimulator-v0', integrator='numba_rk4', array_decomposition=True)
+    hiv.reset()
+    arrays.reset()
+    for action in range(4):
+        typed_reward = hiv.step(action)[3]['reward_decomposition']
+        expected = arrays.step(action)[3]['reward_decomposition']
+        # One decomposition per step, ordered like the array one
+        assert [*typed_reward] == DECOMPOSITION_KEYS
+        assert np.allclose([*typed_reward.values()], expected, atol=1e-3)
+    assert len(calls) == 8
+
+
+def test_decomposition_check_hiv(caplog, monkeypatch):
+    from gym_decomp.hiv import DECOMPOSITION_KEYS, HivSimV0
+
+    hiv = gym.make('HivSimulator-v0', check_every=0)
+    hiv.reset()
+    for action in range(4):
+        _, reward, _, info = hiv.step(action)
+        assert [*info['reward_decomposition']] == DECOMPOSITION_KEYS
+        assert abs(sum(info['reward_decomposition'].values()) - reward) < 1e-2
+    assert not caplog.records
+
+    hiv = gym.make('HivSimulator-v0', array_decomposition=True, check_every=3)
+    hiv.reset()
+    for _ in range(3):
+        _, _, _, info = hiv.step(3)
+        assert 'warning_decomposition_mismatch' not in info
+
+    checks = []
+    monkeypatch.setattr(HivSimV0, '_HivSimV0__check_decomposition',
+                        staticmethod(lambda reward, info: checks.append(reward)))
+    for _ in range(9):
+        hiv.step(3)
+    assert len(checks) == 3
+
+
+def test_numba_integrator_hiv():
+    reference = gym.make('HivSimulator-v0', array_decomposition=True)
+    compiled = gym.make('HivSimulator-v0', array_decomposition=True, integrator='numba_rk4')
+    assert compiled.unwrapped.integrator == 'numba_rk4'
+    assert np.allclose(compiled.reset(), reference.reset())
+
+    rng = np.random.RandomState(0)
+    for _ in range(200):
+        action = rng.randint(4)
+        nxt, reward, terminal, info = compiled.step(action)
+        ref_nxt, _, ref_terminal, ref_info = reference.step(action)
+
+        assert isinstance(reward, float)
+        assert abs(info['reward_decomposition'].sum() - reward) < 1e-6 * abs(reward)
+        assert 'warning_decomposition_mismatch' not in info
+        assert terminal == ref_terminal
+        assert np.abs(nxt - ref_nxt).max() < 1e-3
+        assert np.allclose(info['reward_decomposition'], ref_info['reward_decomposition'],
+                           rtol=1e-2)
+    assert terminal
+
+
+def test_numba_matches_numpy_dynamics_hiv():
+    from gym_decomp.hiv import dynamics, jit
+
+    states = np.tile(dynamics.INITIAL_STATE, (4, 1))
+    for _ in range(20):
+        actions = np.arange(4)
+        expected = dynamics.integrate(states, actions)
+        for idx, action in enumerate(actions):
+            eps1, eps2 = dynamics.ACTION_EFFICACIES[action]
+            compiled = jit.integrate(states[idx], eps1, eps2, dynamics.DT, 1.0, 25)
+            assert np.allclose(compiled, expected[idx], rtol=1e-12)
+        states = expected
+
+
+def test_unknown_integrator_hiv():
+    with pytest.raises(ValueError):
+        gym.make('HivSimulator-v0', integrator='euler')
+
+
+def test_accuracy_report_hiv():
+    from gym_decomp.hiv import accuracy
+
+    report = accuracy.accuracy_report({'short': accuracy.STANDARD_SCHEDULES['random'][:20]})
+    assert report['short']['max_obs_error'] < 1e-3
+    assert report['short']['return_error'] < 1e-3
+    assert 'short' in accuracy.format_report(report)
+
+
+@pytest.mark.parametrize('integrator', ['reference', 'numba_rk4'])
+def test_snapshot_hiv(integrator):
+    hiv = gym.make('HivSimulator-v0', integrator=integrator).unwrapped
+    hiv.reset()
+    for action in range(4):
+        hiv.step(action)
+
+    snapshot = hiv.get_state()
+    first = [hiv.step(action)[:3] for action in [3, 3, 0, 1]]
+    restored = hiv.set_state(snapshot)
+    assert np.allclose(restored, np.log10(snapshot[0]))
+    second = [hiv.step(action)[:3] for action in [3, 3, 0, 1]]
+
+    for (obs, reward, terminal), (obs2, reward2, terminal2) in zip(first, second):
+        assert np.array_equal(obs, obs2) and reward == reward2 and terminal == terminal2
+
+
+def test_plan_evaluator_hiv():
+    from gym_decomp.hiv.planning import PlanEvaluator
+
+    # Every 2-phase schedule of 6 steps, plus a plan that is a prefix of the others
+    plans = [[first] * 3 + [second] * 3 for first in range(4) for second in range(4)]
+    plans.append([3, 3])
+
+    evaluator = PlanEvaluator(gamma=0.9, integrator='numba_rk4')
+    returns = evaluator.evaluate(plans)
+    assert returns.shape == (len(plans), 4)
+    # 4 prefixes of 3 steps, then 16 suffixes of 3 steps
+    assert evaluator.simulated_steps == 4 * 3 + 16 * 3
+
+    hiv = gym.make('HivSimulator-v0', array_decomposition=True, integrator='numba_rk4')
+    for plan, plan_return in zip(plans, returns):
+        hiv.reset()
+        expected = sum(0.9 ** step * hiv.step(action)[3]['reward_decomposition']
+                       for step, action in enumerate(plan))
+        assert np.allclose(plan_return, expected, rtol=1e-12)
+
+    # Plans can also start from a snapshot
+    hiv.reset()
+    hiv.step(3)
+    snapshot = hiv.unwrapped.get_state()
+    assert np.allclose(evaluator.evaluate([[3, 3, 3]], start=snapshot)[0],
+                       hiv.step(3)[3]['reward_decomposition'] +
+                       0.9 * hiv.step(3)[3]['reward_decomposition'] +
+                       0.81 * hiv.step(3)[3]['reward_decomposition'])
+
+
+def test_memo_hiv():
+    hiv = gym.make('HivSimulator-v0', array_decomposition=True, integrator='numba_rk4',
+                   memo_size=8).unwrapped
+    plain = gym.make('HivSimulator-v0', array_decomposition=True, integrator='numba_rk4')
+
+    for _ in range(3):
+        hiv.reset()
+        plain.reset()
+        for action in [3, 3, 0, 1]:
+            nxt, reward, terminal, info = hiv.step(action)
+            expected = plain.step(action)
+            assert np.array_equal(nxt, expected[0]) and reward == expected[1]
+            assert terminal == expected[2]
+            assert np.array_equal(info['reward_decomposition'], expected[3]['reward_decomposition'])
+
+    assert hiv.memo.misses == 4 and hiv.memo.hits == 8 and len(hiv.memo) == 4
+    assert hiv.get_state()[1] == 4
+
+
+def test_memo_dict_decomposition_hiv(monkeypatch):
+    from gym_decomp.hiv.jit import JitHIVTreatment
+
+    hiv = gym.make('HivSimulator-v0', integrator='numba_rk4', memo_size=8).unwrapped
+    hiv.reset()
+    expected = [hiv.step(action)[3] for action in [3, 0]]
+
+    # Hits come straight from the memo, without asking the simulator again
+    def fail(*_):
+        raise AssertionError("typed_reward called on a memo hit")
+    monkeypatch.setattr(JitHIVTreatment, 'typed_reward', fail)
+    hiv.reset()
+    for action, info in zip([3, 0], expected):
+        assert hiv.step(action)[3] == info
+    assert hiv.memo.hits == 2
+
+
+def test_memo_eviction_hiv():
+    from gym_decomp.hiv.memo import TransitionMemo
+
+    memo = TransitionMemo(max_size=2, tolerance=1e-3)
+    state = np.array([1e5, 10., 1e4, 10., 1e4, 10.])
+    memo.put(memo.key(state, 0), 'a')
+    memo.put(memo.key(state, 1), 'b')
+
+    # Within the tolerance, the same entry is found
+    assert memo.get(memo.key(state * (1 + 1e-4), 0)) == 'a'
+    assert memo.get(memo.key(state * 1.1, 0)) is None
+
+    # 'b' is now the least recently used
+    memo.put(memo.key(state, 2), 'c')
+    assert memo.get(memo.key(state, 1)) is None
+    assert memo.get(memo.key(state, 0)) == 'a'
+    assert (memo.hits, memo.misses, len(memo)) == (2, 2, 2)
+
+
+def test_memo_nonpositive_states_hiv():
+    from gym_decomp.hiv.memo import TransitionMemo
+
+    memo = TransitionMemo(max_size=2, tolerance=1e-3)
+    state = np.array([1e5, 0., 1e4, -1e-9, 1e4, 10.])
+    memo.put(memo.key(state, 0), 'a')
+
+    assert memo.get(memo.key(state.copy(), 0)) == 'a'
+
+    with pytest.raises(ValueError):
+        TransitionMemo(max_size=0)
+
+
+def test_profiled_hiv():
+    hiv = gym.make('HivSimulator-v0', integrator='numba_rk4', memo_size=4, profile=True).unwrapped
+    for _ in range(2):
+        hiv.reset()
+        for action in range(3):
+            hiv.step(action)
+
+    stats = hiv.profiler.stats()
+    assert stats['reset']['count'] == 2
+    assert stats['memo']['count'] == stats['check']['count'] == 6
+    assert stats['integrate']['count'] == stats['reward']['count'] == 3
+    assert stats['memo_hit']['count'] == 3
@@ -0,0 +1,32 @@
+"""
+Tests for the pool of pre-reset SCAII worlds, which doesn't need SCAII itself
+"""
+from gym_decomp.scaii.pool import ResetPool
+
+# pylint: disable=C0111
+
+
+def test_reset_pool():
+    class CountingWorld(object):
+        def __init__(self):
+            self.resets = 0
+
+        def reset(self):
+            self.resets += 1
+            return self.resets
+
+    worlds = [CountingWorld() for _ in range(2)]
+    pool = ResetPool(worlds)
+    assert pool.size == 2
+
+    playing = CountingWorld()
+    world, obs = pool.take(playing)
+    assert world is worlds[0] and obs == 1
+    world, obs = pool.take(world)
+    assert world is worlds[1] and obs == 1
+    world, obs = pool.take(world)
+    assert world is playing and obs == 1
+    world, obs = pool.take(world)
+    assert world is worlds[0] and obs == 2
+
+    pool.close()
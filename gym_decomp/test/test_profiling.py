@@ -0,0 +1,47 @@
+"""
+Tests for the step profiling hooks
+"""
+import time
+
+import gym
+
+import gym_decomp as _
+from gym_decomp.profiling import BIN_EDGES, PhaseTimer
+
+# pylint: disable=C0111
+
+
+def test_phase_timer():
+    timer = PhaseTimer()
+    for _ in range(10):
+        timer.start()
+        timer.lap('fast')
+        time.sleep(0.002)
+        timer.lap('slow')
+
+    stats = timer.stats()
+    assert stats['fast']['count'] == stats['slow']['count'] == 10
+    assert stats['slow']['min_sec'] >= 0.002
+    assert stats['fast']['max_sec'] < stats['slow']['min_sec']
+    assert stats['slow']['p50_sec'] <= stats['slow']['p99_sec'] <= stats['slow']['max_sec']
+    assert abs(stats['slow']['mean_sec'] * 10 - stats['slow']['total_sec']) < 1e-12
+    assert sum(stats['slow']['histogram']) == 10
+    assert len(stats['slow']['histogram']) == len(BIN_EDGES) + 1
+
+    timer.reset()
+    assert timer.stats() == {}
+
+
+def test_profiled_gridworld():
+    env = gym.make('Cliffworld-v0', profile=True).unwrapped
+    assert gym.make('Cliffworld-v0').unwrapped.profiler is None
+
+    env.reset()
+    for _ in range(20):
+        _, _, terminal, _ = env.step(env.action_space.sample())
+        if terminal:
+            env.reset()
+
+    stats = env.profiler.stats()
+    assert stats['act']['count'] == stats['decomposition']['count'] == 20
+    assert stats['observe']['count'] == 20 + stats['reset']['count']
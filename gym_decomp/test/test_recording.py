@@ -0,0 +1,125 @@
+"""
+Tests for the trajectory recorder
+"""
+import gym
+import numpy as np
+import pytest
+
+import gym_decomp as _
+from gym_decomp.recording import TrajectoryReader, TrajectoryRecorder
+
+# pylint: disable=C0111
+
+
+def test_trajectory_recorder(tmp_path):
+    env = TrajectoryRecorder(gym.make('Cliffworld-v0', obs_mode='index'), tmp_path, chunk_size=16)
+    env.seed(0)
+
+    expected = []
+    obs = env.reset()
+    for _ in range(40):
+        action = env.action_space.sample()
+        nxt, reward, terminal, info = env.step(action)
+        expected.append((obs, action, reward, terminal, info['reward_decomposition'].copy()))
+        obs = env.reset() if terminal else nxt
+
+    env.flush()
+    assert TrajectoryReader(tmp_path).num_chunks == 2
+    env.close()
+
+    reader = TrajectoryReader(tmp_path)
+    assert reader.reward_types == env.unwrapped.reward_types
+    assert len(reader) == 40 and reader.num_chunks == 3
+
+    columns = {name: np.concatenate(reader.column(name)) for name in ['obs', 'action', 'reward',
+                                                                      'terminal']}
+    decomp = np.concatenate([reader.decomposed_rewards(idx) for idx in range(reader.num_chunks)])
+    for row, (obs, action, reward, terminal, typed_reward) in enumerate(expected):
+        assert columns['obs'][row] == obs and columns['action'][row] == action
+        assert columns['reward'][row] == reward and columns['terminal'][row] == terminal
+        assert (decomp[row] == typed_reward).all()
+
+    chunk = reader.chunk(2)
+    assert isinstance(chunk['reward'], np.memmap) and not chunk['reward'].flags.writeable
+    assert len(chunk['reward']) == 40 - 2 * 16
+
+
+def test_trajectory_recorder_onehot(tmp_path):
+    env = TrajectoryRecorder(gym.make('MiniGridworld-v0', obs_dtype=np.uint8), tmp_path)
+    obs = env.reset().copy()
+    env.step(3)
+    env.close()
+
+    recorded = TrajectoryReader(tmp_path).chunk(0)['obs']
+    assert recorded.dtype == np.uint8 and (recorded[0] == obs).all()
+
+
+def test_trajectory_recorder_obs_buffer(tmp_path):
+    # One-hot rows of 20 bytes, an int64 action and 5 float64 or bool scalars
+    env = TrajectoryRecorder(gym.make('Cliffworld-v0', obs_dtype=np.uint8, obs_buffer=True),
+                             tmp_path, chunk_bytes=1000)
+    env.seed(0)
+
+    expected = []
+    obs = env.reset().copy()
+    for _ in range(30):
+        nxt, _, terminal, _ = env.step(1)
+        expected.append(obs)
+        obs = env.reset().copy() if terminal else nxt.copy()
+    env.close()
+
+    row_bytes = 20 + 8 + 8 + 1 + 8 * len(env.unwrapped.reward_types)
+    assert env.chunk_size == 1000 // row_bytes
+
+    reader = TrajectoryReader(tmp_path)
+    recorded = np.concatenate(reader.column('obs'))
+    assert len(recorded) == 30 and (recorded == expected).all()
+
+    # The last chunk only takes up the rows it holds
+    last = np.load(str(tmp_path / ("chunk_%05d" % (reader.num_chunks - 1)) / "col_0.npy"))
+    assert len(last) == 30 % env.chunk_size
+
+
+def test_trajectory_recorder_step_before_reset(tmp_path):
+    env = TrajectoryRecorder(gym.make('Cliffworld-v0'), tmp_path)
+    with pytest.raises(Exception, match="reset"):
+        env.step(0)
+    env.close()
+
+
+def test_trajectory_recorder_dict_obs(tmp_path):
+    class DictObservation(gym.ObservationWrapper):
+        def observation(self, observation):
+            return {'onehot': observation.astype(np.uint8),
+                    'index': np.array([observation.argmax()], dtype=np.int64)}
+
+    env = TrajectoryRecorder(DictObservation(gym.make('Cliffworld-v0')), tmp_path)
+    obs = env.reset()
+    env.step(3)
+    env.close()
+
+    chunk = TrajectoryReader(tmp_path).chunk(0)
+    assert chunk['obs/onehot'].dtype == np.uint8 and chunk['obs/index'].dtype == np.int64
+    assert (chunk['obs/onehot'][0] == obs['onehot']).all()
+    assert chunk['obs/index'][0] == obs['index']
+
+
+def test_trajectory_recorder_write_error(tmp_path, monkeypatch):
+    from gym_decomp import recording
+
+    def disk_full(*_):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(recording, 'write_json_atomic', disk_full)
+
+    env = TrajectoryRecorder(gym.make('Cliffworld-v0'), tmp_path, chunk_size=2)
+    env.reset()
+    for _ in range(5):
+        env.step(1)
+    with pytest.raises(Exception, match="Failed to write") as err:
+        env.flush()
+    assert isinstance(err.value.__cause__, OSError)
+
+    with pytest.raises(Exception, match="Failed to write"):
+        env.step(1)
+    with pytest.raises(Exception, match="Failed to write"):
+        env.close()
@@ -0,0 +1,82 @@
+"""
+Tests for the decomposed replay buffer
+"""
+import gym
+import numpy as np
+import pytest
+
+import gym_decomp as _
+from gym_decomp.replay import DecomposedReplayBuffer, SumTree
+
+# pylint: disable=C0111
+
+
+def test_sum_tree():
+    rng = np.random.RandomState(0)
+    tree = SumTree(13)
+    priorities = rng.rand(13)
+    tree.update(np.arange(13), priorities)
+    assert np.isclose(tree.total, priorities.sum())
+
+    priorities[[2, 7]] = [5.0, 0.0]
+    tree.update([2, 7, 7], [5.0, 3.0, 0.0])
+    assert np.allclose(tree[np.arange(13)], priorities)
+
+    values = rng.rand(1000) * tree.total
+    expected = np.searchsorted(np.cumsum(priorities), values, side='right')
+    assert (tree.find(values) == expected).all()
+
+
+def test_replay_ring():
+    buffer = DecomposedReplayBuffer(5, (2,), ['a', 'b'], prioritized=False, seed=0)
+    for step in range(7):
+        buffer.add([step, step], step, [step, -step], [step + 1, step + 1], step == 6)
+
+    assert len(buffer) == 5
+    assert sorted(buffer.rewards[:, 0]) == [2, 3, 4, 5, 6]
+
+    batch = buffer.sample(64)
+    assert batch['rewards'].shape == (64, 2) and (batch['weights'] == 1).all()
+    assert (batch['rewards'][:, 0] == batch['actions']).all()
+    assert (batch['next_obs'][:, 0] == batch['obs'][:, 0] + 1).all()
+    assert (batch['terminals'] == (batch['actions'] == 6)).all()
+
+    with pytest.raises(ValueError):
+        buffer.add_batch(np.zeros((2, 2)), [0, 0], np.zeros((2, 3)), np.zeros((2, 2)), [0, 0])
+
+
+def test_prioritized_replay():
+    buffer = DecomposedReplayBuffer(4, (1,), ['a', 'b'], alpha=1.0, eps=0.0, seed=0)
+    indices = buffer.add_batch(np.zeros((4, 1)), np.arange(4), np.zeros((4, 2)),
+                               np.zeros((4, 1)), np.zeros(4))
+
+    # Per-component TD errors are summed into one priority
+    buffer.update_priorities(indices, [[1, 0], [0.5, 0.5], [-2, 0], [4, 0]])
+    batch = buffer.sample(8000, beta=1.0)
+    freqs = np.bincount(batch['actions'], minlength=4) / 8000
+    assert np.allclose(freqs, [1 / 8, 1 / 8, 2 / 8, 4 / 8], atol=0.02)
+
+    # The weights undo the sampling bias
+    assert np.allclose(batch['weights'] * freqs[batch['actions']],
+                       (batch['weights'] * freqs[batch['actions']]).max(), rtol=0.1)
+
+    # New transitions get the highest priority seen so far, replacing the oldest
+    buffer.add([0], 4, [0, 0], [0], False)
+    freqs = np.bincount(buffer.sample(8000)['actions'], minlength=5) / 8000
+    assert np.allclose(freqs, [0, 1 / 11, 2 / 11, 4 / 11, 4 / 11], atol=0.02)
+
+
+def test_replay_from_env():
+    env = gym.make('Cliffworld-v0', array_decomposition=True)
+    buffer = DecomposedReplayBuffer.from_env(env, 100)
+    assert buffer.reward_types == env.unwrapped.reward_types
+
+    obs = env.reset()
+    for _ in range(10):
+        action = env.action_space.sample()
+        nxt, _, terminal, info = env.step(action)
+        buffer.add(obs, action, info['reward_decomposition'], nxt, terminal)
+        obs = env.reset() if terminal else nxt
+
+    batch = buffer.sample(4)
+    assert batch['obs'].shape == (4,) + env.observation_space.shape
@@ -51,3 +51,183 @@ def test_act_scaii():
         total += val
 
     assert total - reward < 1e-8
+
+
+def test_array_decomposition_scaii():
+    scaii = gym.make('ScaiiFourTowers-v1', array_decomposition=True)
+    scaii.reset()
+
+    _, reward, _, info = scaii.step(2)
+
+    typed_rewards = info['reward_decomposition']
+    assert typed_rewards.shape == (len(scaii.reward_types),)
+    assert abs(typed_rewards.sum() - reward) < 1e-8
+
+
+def test_reset_pool_scaii():
+    scaii = gym.make('ScaiiFourTowers-v1', reset_pool_size=1)
+
+    for _ in range(3):
+        state = scaii.reset()
+        assert len(state) == 40*40*8
+        scaii.step(2)
+
+    scaii.close()
+
+
+def test_state_views_scaii():
+    import numpy as np
+
+    scaii = gym.make('ScaiiFourTowers-v1').unwrapped
+    state = scaii.reset()
+
+    assert not state.flags.writeable
+    assert state is scaii.curr_state
+    assert np.shares_memory(state, scaii.unflattened_state)
+    assert scaii.unflattened_state.shape == (40, 40, 8)
+
+    nxt, _, _, _ = scaii.step(2)
+    assert nxt is scaii.curr_state and nxt is not state
+
+
+def test_layer_selection_scaii():
+    import numpy as np
+    import pytest
+    from gym_decomp.scaii import LAYERS
+
+    scaii = gym.make('ScaiiFourTowers-v1', layers=['hp', 'friend', 'enemy'],
+                     layer_dtypes=np.float32).unwrapped
+    state = scaii.reset()
+    assert state.shape == (40*40*3,) and state.dtype == np.float32
+    assert np.array_equal(state.reshape(40, 40, 3),
+                          scaii.unflattened_state[..., :3].astype(np.float32))
+
+    scaii = gym.make('ScaiiFourTowers-v1', layers=['hp', 'tank', 'small city'],
+                     layer_dtypes={'hp': np.float32, 'tank': np.uint8,
+                                   'small city': np.uint8}).unwrapped
+    # Every dtype is given, so they are known before the first reset
+    assert scaii.layer_dtypes == {'hp': np.float32, 'tank': np.uint8, 'small city': np.uint8}
+    scaii.flatten_state = False
+    scaii.reset()
+    state, _, _, _ = scaii.step(2)
+    assert [*state] == scaii.layers
+    assert state['hp'].shape == (40, 40) and state['hp'].dtype == np.float32
+    assert state['tank'].dtype == np.uint8 and state['small city'].dtype == np.uint8
+    assert np.array_equal(state['tank'],
+                          scaii.unflattened_state[..., LAYERS.index('tank')].astype(np.uint8))
+    assert scaii.layer_dtypes == {'hp': np.float32, 'tank': np.uint8, 'small city': np.uint8}
+
+    with pytest.raises(ValueError):
+        gym.make('ScaiiFourTowers-v1', layers=['hp', 'walls'])
+
+    # The hp layer keeps the backend's dtype
+    scaii = gym.make('ScaiiFourTowers-v1', layer_dtypes={'friend': np.uint8}).unwrapped
+    with pytest.raises(Exception, match="first reset"):
+        scaii.layer_dtypes  # pylint: disable=W0104
+    scaii.reset()
+    assert scaii.layer_dtypes['hp'] == scaii.unflattened_state.dtype
+
+
+def test_replay_archiver(tmp_path):
+    from gym_decomp.scaii.recording import ReplayArchiver, load_replay, read_index
+
+    # Left over from an earlier run
+    replay_file = tmp_path / "replay.scr"
+    replay_file.write_bytes(b"stale")
+
+    archiver = ReplayArchiver(tmp_path)
+    assert not replay_file.exists()
+    assert (tmp_path / "archive" / ("%s_stale.scr" % archiver.session)).read_bytes() == b"stale"
+
+    contents = []
+    for episode in range(3):
+        contents.append(bytes([episode]) * 1000)
+        replay_file.write_bytes(contents[-1])
+        archiver.archive(replay_file, episode)
+        assert not replay_file.exists()
+
+    # Nothing to archive
+    archiver.archive(replay_file, 3)
+    archiver.close()
+
+    index = read_index(tmp_path)
+    assert [entry['episode'] for entry in index] == [0, 1, 2]
+    for entry, content in zip(index, contents):
+        assert entry['session'] == archiver.session
+        assert entry['compressed_bytes'] < entry['raw_bytes'] == len(content)
+        assert load_replay(tmp_path, entry) == content
+    assert not [*(tmp_path / "archive").glob("*.pending")]
+
+
+def test_lazy_import_scaii(tmp_path):
+    import subprocess
+    import sys
+
+    # Importing doesn't look for (or try to install) SCAII in an empty home directory
+    env = dict(os.environ, HOME=str(tmp_path))
+    subprocess.run([sys.executable, '-c', 'import gym_decomp.scaii'], env=env,
+                   stdin=subprocess.DEVNULL, check=True)
+    assert not (tmp_path / ".scaii").exists()
+
+
+def test_install_from_archive_scaii(tmp_path):
+    import subprocess
+    import sys
+    import tarfile
+    from gym_decomp.scaii import bootstrap
+
+    # A minimal release layout with just the modules the install check imports
+    release = tmp_path / "release" / ".scaii"
+    glue = release / "glue" / "python" / "scaii"
+    scenarios = glue / "env" / "sky_rts" / "env" / "scenarios"
+    scenarios.mkdir(parents=True)
+    for sub_dir in ["bin", "backends"]:
+        (release / sub_dir).mkdir()
+    for package in [glue, glue / "env", glue / "env" / "sky_rts", scenarios.parent, scenarios]:
+        (package / "__init__.py").write_text("")
+    (scenarios / "city_attack.py").write_text("CityAttack = object\n")
+    (glue / "env" / "explanation.py").write_text(
+        "Explanation = BarChart = BarGroup = Bar = object\n")
+
+    archive = tmp_path / "Linux-x86_64.scaii.tar.gz"
+    with tarfile.open(str(archive), mode='w:gz') as tar:
+        tar.add(str(release), arcname=".scaii")
+
+    # No prompt, so it works without stdin
+    home = tmp_path / "home"
+    home.mkdir()
+    env = dict(os.environ, HOME=str(home), **{bootstrap.ARCHIVE_ENV_VAR: str(archive)})
+    subprocess.run([sys.executable, '-c', 'from gym_decomp.scaii import bootstrap; '
+                                          'bootstrap.check_setup()'],
+                   env=env, stdin=subprocess.DEVNULL, check=True, timeout=60)
+    assert (home / ".scaii" / bootstrap.VERIFIED_MARKER).exists()
+
+
+def test_verified_marker_scaii(tmp_path, monkeypatch):
+    from gym_decomp.scaii import bootstrap
+
+    monkeypatch.setenv('HOME', str(tmp_path))
+    assert not bootstrap.is_installed() and not bootstrap.is_verified()
+
+    for sub_dir in ["bin", "backends", "glue/python"]:
+        (tmp_path / ".scaii" / sub_dir).mkdir(parents=True)
+    assert bootstrap.is_installed() and not bootstrap.is_verified()
+
+    (tmp_path / ".scaii" / bootstrap.VERIFIED_MARKER).write_text(bootstrap.install_key())
+    assert bootstrap.is_verified()
+
+    # Reinstalling the glue invalidates the marker
+    glue = tmp_path / ".scaii" / "glue" / "python"
+    os.utime(str(glue), ns=(0, 0))
+    assert not bootstrap.is_verified()
+
+
+def test_profiled_scaii():
+    scaii = gym.make('ScaiiFourTowers-v1', profile=True).unwrapped
+    scaii.reset()
+    scaii.step(2)
+
+    stats = scaii.profiler.stats()
+    assert stats['reset']['count'] == 1
+    assert stats['act']['count'] == stats['decomposition']['count'] == 1
+    assert 'explanation' not in stats
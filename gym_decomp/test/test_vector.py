@@ -0,0 +1,143 @@
+"""
+Tests for the subprocess vector environment
+"""
+import gym
+from gym import spaces
+from gym.envs.registration import register, registry
+import numpy as np
+import pytest
+
+import gym_decomp as _
+from gym_decomp.vector import SubprocVectorEnv
+
+# pylint: disable=C0111
+
+
+class RaisingEnv(gym.Env):
+    """
+    Raises on the action 1
+    """
+
+    reward_types = ['only']
+    array_decomposition = False
+    observation_space = spaces.Box(0, 1, (2,), dtype=np.float64)
+    action_space = spaces.Discrete(2)
+
+    def reset(self):
+        return np.zeros(2)
+
+    def step(self, action):
+        if action == 1:
+            raise ValueError("Bad action")
+        return np.ones(2), 1.0, False, {'reward_decomposition': np.ones(1)}
+
+
+class DictObservation(gym.ObservationWrapper):
+    """
+    Splits a one-hot gridworld observation into a dict of differently typed arrays
+    """
+
+    def observation(self, observation):
+        return {'onehot': observation.astype(np.uint8),
+                'index': np.array([observation.argmax()], dtype=np.int64)}
+
+
+def make_dict_env():
+    return DictObservation(gym.make('Cliffworld-v0'))
+
+
+if 'RaisingTest-v0' not in registry.env_specs:
+    register(id='RaisingTest-v0', entry_point=RaisingEnv)
+    register(id='DictObsTest-v0', entry_point=make_dict_env)
+
+
+def test_subproc_vector_env():
+    num_envs = 3
+    vec = SubprocVectorEnv('Cliffworld-v0', num_envs)
+    envs = [gym.make('Cliffworld-v0', array_decomposition=True) for _ in range(num_envs)]
+    try:
+        vec.seed(0)
+        for idx, env in enumerate(envs):
+            env.seed(idx)
+        assert vec.reward_types == envs[0].reward_types
+
+        obs = vec.reset()
+        assert obs.shape == (num_envs,) + envs[0].observation_space.shape
+        assert (obs == [env.reset() for env in envs]).all()
+
+        rng = np.random.RandomState(0)
+        for _ in range(100):
+            actions = rng.randint(4, size=num_envs)
+            vec.step_async(actions)
+            obs, reward, terminal, info = vec.step_wait()
+            assert info['reward_decomposition'].shape == (num_envs, len(vec.reward_types))
+
+            for idx, env in enumerate(envs):
+                nxt, env_reward, env_terminal, env_info = env.step(actions[idx])
+                if env_terminal:
+                    nxt = env.reset()
+                assert (obs[idx] == nxt).all()
+                assert reward[idx] == env_reward and terminal[idx] == env_terminal
+                assert (info['reward_decomposition'][idx] ==
+                        env_info['reward_decomposition']).all()
+    finally:
+        vec.close()
+
+
+def test_subproc_shared_obs():
+    vec = SubprocVectorEnv('Cliffworld-v0', 2, env_kwargs={'obs_mode': 'index'},
+                           obs_shape=(), obs_dtype=np.int64, copy_obs=False)
+    try:
+        obs = vec.reset()
+        assert obs.shape == (2,) and obs.dtype == np.int64
+        assert vec.step([0, 1])[0] is obs
+
+        # Nothing is sent, so the environments still answer the next step
+        with pytest.raises(ValueError):
+            vec.step([0])
+        assert vec.step([0, 1])[0] is obs
+    finally:
+        vec.close()
+
+
+def test_subproc_worker_exception():
+    vec = SubprocVectorEnv('RaisingTest-v0', 2, context='fork')
+    try:
+        vec.reset()
+        with pytest.raises(ValueError, match="Bad action"):
+            vec.step([0, 1])
+
+        # Both workers answered, so the environments can still be used
+        obs, reward, _, _ = vec.step([0, 0])
+        assert (obs == 1).all() and (reward == 1).all()
+    finally:
+        vec.close()
+
+
+def test_subproc_make_exception():
+    with pytest.raises(TypeError):
+        SubprocVectorEnv('Cliffworld-v0', 2, env_kwargs={'no_such_arg': 1}, obs_shape=(2,))
+
+
+def test_subproc_dict_obs():
+    vec = SubprocVectorEnv('DictObsTest-v0', 2, context='fork')
+    env = make_dict_env()
+    try:
+        vec.seed(0)
+        env.seed(0)
+
+        obs = vec.reset()
+        assert obs['onehot'].shape == (2, 20) and obs['onehot'].dtype == np.uint8
+        assert obs['index'].shape == (2, 1) and obs['index'].dtype == np.int64
+
+        expected = env.reset()
+        for action in [0, 3, 3, 1]:
+            obs, _, terminal, _ = vec.step([action, action])
+            expected, _, env_terminal, _ = env.step(action)
+            if env_terminal:
+                expected = env.reset()
+            assert terminal[0] == env_terminal
+            assert (obs['onehot'][0] == expected['onehot']).all()
+            assert obs['index'][0] == expected['index']
+    finally:
+        vec.close()
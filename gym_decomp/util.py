@@ -0,0 +1,18 @@
+"""
+Small helpers shared across the package.
+"""
+import json
+import os
+from pathlib import Path
+
+
+def write_json_atomic(path, data):
+    """
+    Writes `data` as JSON to `path` through a temporary file and a rename, so readers never
+    see it half written
+    """
+    path = Path(path)
+    tmp_path = path.with_suffix('.tmp')
+    with open(str(tmp_path), 'w') as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(str(tmp_path), str(path))
@@ -0,0 +1,290 @@
+"""
+Runs several copies of any registered `gym_decomp` environment in worker processes.
+
+Observations are written by the workers straight into one shared-memory array instead of
+being pickled through the pipes, which matters for large observations like the 40x40x8
+SCAII maps. Only actions, rewards and reward decompositions go through the pipes.
+"""
+import multiprocessing
+import pickle
+import traceback
+
+import gym
+import numpy as np
+
+# pylint: disable=C0103
+
+
+class _RemoteTraceback(Exception):
+    """
+    The traceback of an exception raised in a worker, chained to it when it is re-raised
+    """
+
+    def __init__(self, tb):
+        super().__init__(tb)
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def _pickleable(err):
+    try:
+        pickle.dumps(err)
+        return err
+    except Exception:  # pylint: disable=W0703
+        return Exception(repr(err))
+
+
+def _shared_views(shared_obs):
+    """
+    Array views of the `(raw array, shape, dtype)` of the shared observations, or of a dict
+    of them for dict observations
+    """
+    if isinstance(shared_obs, dict):
+        return {key: _shared_views(shared) for key, shared in shared_obs.items()}
+    raw, shape, dtype = shared_obs
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _write_obs(obs_buffer, idx, obs):
+    if isinstance(obs_buffer, dict):
+        for key, buffer in obs_buffer.items():
+            buffer[idx] = obs[key]
+    else:
+        obs_buffer[idx] = obs
+
+
+def _worker(remote, parent_remote, env_id, env_kwargs, shared_obs, idx):
+    parent_remote.close()
+    obs_buffer = _shared_views(shared_obs)
+    env, error = None, None
+    try:
+        env = gym.make(env_id, **env_kwargs)
+        env.unwrapped.array_decomposition = True
+    except Exception as err:  # pylint: disable=W0703
+        error = (_pickleable(err), traceback.format_exc())
+
+    # Every command is answered with `(True, result)`, or `(False, (exception, traceback))`
+    # if it raised, so the parent never waits on a worker that failed
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'close':
+                if env is not None:
+                    env.close()
+                break
+            if error is not None:
+                remote.send((False, error))
+                continue
+
+            try:
+                if cmd == 'step':
+                    obs, reward, terminal, info = env.step(data)
+                    if terminal:
+                        obs = env.reset()
+                    _write_obs(obs_buffer, idx, obs)
+                    decomp = info.pop('reward_decomposition')
+                    result = (reward, terminal, decomp, info)
+                elif cmd == 'reset':
+                    _write_obs(obs_buffer, idx, env.reset())
+                    result = None
+                elif cmd == 'seed':
+                    result = env.seed(data)
+                elif cmd == 'reward_types':
+                    result = [*env.unwrapped.reward_types]
+                else:
+                    raise NotImplementedError("Unknown command %s" % cmd)
+            except Exception as err:  # pylint: disable=W0703
+                remote.send((False, (_pickleable(err), traceback.format_exc())))
+            else:
+                remote.send((True, result))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        remote.close()
+
+
+def _receive(remotes):
+    """
+    The results of the last command sent to each of `remotes`. If any of them raised, the
+    first exception is re-raised once every result is in, so the pipes stay in step.
+    """
+    replies = [remote.recv() for remote in remotes]
+    for success, result in replies:
+        if not success:
+            err, tb = result
+            raise err from _RemoteTraceback(tb)
+    return [result for _, result in replies]
+
+
+def _probe_observation(env_id, env_kwargs):
+    env = gym.make(env_id, **env_kwargs)
+    obs = env.reset()
+    env.close()
+    if isinstance(obs, dict):
+        obs = {key: np.asarray(val) for key, val in obs.items()}
+        return ({key: val.shape for key, val in obs.items()},
+                {key: val.dtype for key, val in obs.items()})
+    obs = np.asarray(obs)
+    return obs.shape, obs.dtype
+
+
+class SubprocVectorEnv(object):
+    """
+    Steps `num_envs` copies of the environment `env_id` (made with `env_kwargs`), each in
+    its own process.
+
+    Finished episodes are reset automatically, so the observation returned for an
+    environment that just terminated is the first observation of its next episode.
+
+    The shape and dtype of a single observation are found by making and resetting one
+    environment in this process, unless `obs_shape` (and `obs_dtype`) are given. Pass them
+    for environments that are expensive to start, e.g. `obs_shape=(40 * 40 * 8,)` for
+    `ScaiiFourTowers-v1`.
+
+    Dict observations (e.g. `ScaiiFourTowers-v1` with layers of different dtypes) get one
+    shared array per key, and are returned as a dict of `(num_envs, *shape)` arrays. Their
+    `obs_shape` and `obs_dtype` are dicts of the shape and dtype of each key.
+
+    Observations are copied out of the shared array, or with `copy_obs=False` the shared
+    `(num_envs, *obs_shape)` array itself is returned and is overwritten by the next call.
+
+    An exception raised by an environment is re-raised by the call that caused it, once
+    every environment has answered, with the worker's traceback chained to it.
+
+    Observation Space: An `(num_envs, *obs_shape)` array, or a dict of them
+    Action Space: The action space of the environment, for each copy
+    """
+
+    def __init__(self, env_id, num_envs, env_kwargs=None, obs_shape=None, obs_dtype=np.float64,
+                 copy_obs=True, context=None):
+        env_kwargs = env_kwargs or {}
+        if obs_shape is None:
+            obs_shape, obs_dtype = _probe_observation(env_id, env_kwargs)
+
+        self.__num_envs = num_envs
+        self.__copy_obs = copy_obs
+        self.__waiting = False
+        self.__closed = False
+
+        ctx = multiprocessing.get_context(context)
+        if isinstance(obs_shape, dict):
+            if not isinstance(obs_dtype, dict):
+                obs_dtype = {key: obs_dtype for key in obs_shape}
+            shared_obs = {key: self.__share(ctx, shape, obs_dtype[key])
+                          for key, shape in obs_shape.items()}
+        else:
+            shared_obs = self.__share(ctx, obs_shape, obs_dtype)
+        self.__obs = _shared_views(shared_obs)
+
+        self.__remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self.__procs = []
+        for idx, (work_remote, remote) in enumerate(zip(work_remotes, self.__remotes)):
+            proc = ctx.Process(target=_worker, args=(work_remote, remote, env_id, env_kwargs,
+                                                     shared_obs, idx))
+            proc.daemon = True
+            proc.start()
+            self.__procs.append(proc)
+            work_remote.close()
+
+        try:
+            for remote in self.__remotes:
+                remote.send(('reward_types', None))
+            self.__reward_types = _receive(self.__remotes)[0]
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def num_envs(self):
+        """
+        The number of environments stepped by each call
+        """
+        return self.__num_envs
+
+    @property
+    def reward_types(self):
+        """
+        The reward types, in the order of the columns of the reward decomposition
+        """
+        return self.__reward_types
+
+    def reset(self):
+        for remote in self.__remotes:
+            remote.send(('reset', None))
+        _receive(self.__remotes)
+        return self.__observe()
+
+    def step_async(self, actions):
+        """
+        Sends one action to each environment without waiting for the results,
+        collect them with `step_wait`
+        """
+        if self.__waiting:
+            raise Exception("Already stepping, call step_wait first")
+        if len(actions) != self.__num_envs:
+            raise ValueError("Expected %d actions, one per environment, got %d"
+                             % (self.__num_envs, len(actions)))
+        for remote, action in zip(self.__remotes, actions):
+            remote.send(('step', action))
+        self.__waiting = True
+
+    def step_wait(self):
+        """
+        Waits for the step started by `step_async`.
+
+        Returns the `(num_envs, *obs_shape)` observations, `(num_envs,)` total rewards and
+        terminal flags, and an info dict whose `reward_decomposition` is an
+        `(num_envs, len(reward_types))` array in the order of `reward_types`. Any other info
+        of each environment is under `infos`.
+        """
+        if not self.__waiting:
+            raise Exception("Not stepping, call step_async first")
+        self.__waiting = False
+        results = _receive(self.__remotes)
+
+        rewards, terminals, decomps, infos = zip(*results)
+        info = {'reward_decomposition': np.array(decomps, dtype=float), 'infos': list(infos)}
+        return self.__observe(), np.array(rewards, dtype=float), np.array(terminals), info
+
+    def step(self, actions):
+        """
+        Takes one action per environment, see `step_wait` for what is returned
+        """
+        self.step_async(actions)
+        return self.step_wait()
+
+    def seed(self, seed=None):
+        """
+        Seeds every environment, with `seed + i` for the i-th one, or with the i-th of a list
+        """
+        if seed is None or np.isscalar(seed):
+            seed = [None if seed is None else seed + idx for idx in range(self.num_envs)]
+        for remote, env_seed in zip(self.__remotes, seed):
+            remote.send(('seed', env_seed))
+        return _receive(self.__remotes)
+
+    def close(self):
+        if self.__closed:
+            return
+        if self.__waiting:
+            for remote in self.__remotes:
+                remote.recv()
+        for remote in self.__remotes:
+            remote.send(('close', None))
+        for proc in self.__procs:
+            proc.join()
+        self.__closed = True
+
+    def __share(self, ctx, obs_shape, obs_dtype):
+        shape = (self.__num_envs,) + tuple(obs_shape)
+        obs_dtype = np.dtype(obs_dtype)
+        return ctx.RawArray('b', int(np.prod(shape)) * obs_dtype.itemsize), shape, obs_dtype
+
+    def __observe(self):
+        if not self.__copy_obs:
+            return self.__obs
+        if isinstance(self.__obs, dict):
+            return {key: obs.copy() for key, obs in self.__obs.items()}
+        return self.__obs.copy()
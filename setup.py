@@ -11,6 +11,7 @@ packages = find_namespace_packages(exclude=['tests'])
 base_dir = pathlib.Path(__file__).parent
 
 requirements = ["numpy>=1.0",
+                "scipy>=1.0",
                 "gym==0.12.5",
                 "hip-mdp-public @ https://github.com/Zaerei/hip-mdp-public/archive/master.zip",
                 "llvmlite==0.27.0",